@@ -0,0 +1,230 @@
+import argparse
+import json
+import random
+import time
+import tracemalloc
+import unicodedata
+from types import SimpleNamespace
+
+import bot
+import cache
+
+consonants = ("k", "g", "ŋ", "t", "d", "n", "p", "b", "m", "ts", "tþ", "kx", "pf")
+consonants += ("j", "r", "l", "w", "s", "h", "þ", "ng", "tth")
+vowels = ("a", "i", "u", "e", "o", "æ", "y", "ā", "ī", "ū", "ē", "ō", "ȳ")
+punctuation = (".", ",", "!", ":", "-", "(", ")")
+domains = ("example.com", "t.me", "www.wikipedia.org", "github.com", "x.org")
+
+
+def corpus():
+    """Returns the texts to benchmark with, by kind. They are the same on
+    every run, so that results can be compared across runs."""
+    rng = random.Random(413)
+
+    def word():
+        syllables = rng.randint(1, 4)
+        return "".join(
+            rng.choice(consonants + ("",)) + rng.choice(vowels)
+            for _ in range(syllables)
+        ) + rng.choice(consonants + ("",) * 4)
+
+    def sentence(length):
+        words = []
+        size = 0
+        while size < length:
+            words.append(word())
+            if rng.random() < 0.1:
+                words[-1] += rng.choice(punctuation)
+            size += len(words[-1]) + 1
+        return " ".join(words)[:length]
+
+    def url():
+        return (
+            rng.choice(("https://", "http://", ""))
+            + rng.choice(domains)
+            + rng.choice(("", "/" + word(), "/" + word() + "?q=" + word()))
+        )
+
+    texts = {
+        "inline": [sentence(rng.randint(5, 60)) for _ in range(200)],
+        "long": [sentence(4096) for _ in range(10)],
+        "urls": [
+            " ".join(
+                rng.choice((url(), sentence(rng.randint(5, 30))))
+                for _ in range(rng.randint(5, 40))
+            )
+            for _ in range(50)
+        ],
+    }
+    texts["caps"] = [text.upper() for text in texts["inline"][:100]]
+    texts["caps"] += [text.upper() for text in texts["long"][:3]]
+    texts["decomposed"] = [
+        unicodedata.normalize("NFD", text)
+        for text in texts["inline"][:100] + texts["long"][:3]
+    ]
+    return texts
+
+
+def message_update(text):
+    return SimpleNamespace(
+        message=SimpleNamespace(
+            reply_to_message=SimpleNamespace(text=text, caption=None),
+            reply_text=lambda text: None,
+        )
+    )
+
+
+def inline_update(query, user):
+    return SimpleNamespace(
+        inline_query=SimpleNamespace(
+            query=query,
+            from_user=SimpleNamespace(id=user),
+            answer=lambda results, **kwargs: None,
+        )
+    )
+
+
+def benchmarks(texts):
+    """Yields (name, function, inputs) for every benchmark, where inputs are
+    the arguments to call function with and what each of them measures in
+    characters."""
+    for name, scheme in bot.schemes.items():
+        for kind, kind_texts in texts.items():
+            if name.endswith(" inverse"):
+                # Converts back what the forward scheme made
+                forward = bot.schemes[name[: -len(" inverse")]]
+                kind_texts = [forward.convert(text) for text in kind_texts]
+            yield (
+                "scheme " + name + " " + kind,
+                scheme.convert,
+                [((text,), len(text)) for text in kind_texts],
+            )
+    for kind, kind_texts in texts.items():
+        yield (
+            "url_separate " + kind,
+            lambda text: list(bot.url_separate(text)),
+            [((text,), len(text)) for text in kind_texts],
+        )
+    users = iter(range(1 << 62))
+    yield (
+        "inlinequery inline",
+        lambda query: bot.inlinequery(inline_update(query, next(users)), None),
+        [((text,), len(text)) for text in texts["inline"]],
+    )
+    # One user typing each query out, which resumes from the last one
+    typing = [
+        ((text[:end],), end)
+        for text in texts["inline"][:20]
+        for end in range(1, len(text) + 1)
+    ]
+    yield (
+        "inlinequery typing",
+        lambda query: bot.inlinequery(inline_update(query, 0), None),
+        typing,
+    )
+    for target in ("Cyrillic", "Katakana", "Lontara"):
+        handler = bot.genfunc(target)
+        yield (
+            "/" + target.lower() + " long",
+            lambda text, handler=handler: handler(message_update(text), None),
+            [((text,), len(text)) for text in texts["long"]],
+        )
+
+
+def measure(function, inputs, repeat):
+    """Returns throughput in characters per second, latency percentiles in
+    milliseconds and the peak memory allocated in KiB while running function
+    over inputs."""
+    latencies = []
+    characters = 0
+    for _ in range(repeat):
+        for args, size in inputs:
+            started = time.perf_counter()
+            function(*args)
+            latencies.append(time.perf_counter() - started)
+            characters += size
+    latencies.sort()
+    # Peak memory is measured on a run of its own, since tracing slows
+    # everything down
+    tracemalloc.start()
+    for args, _ in inputs:
+        function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "throughput": characters / sum(latencies),
+        "p50": latencies[len(latencies) // 2] * 1000,
+        "p99": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def main(repeat=5, only=None, save=None, compare=None):
+    bot.load()
+    # Every conversion is measured, rather than a cache lookup
+    bot.conversion_cache = cache.LRUCache(0)
+    baseline = {}
+    if compare is not None:
+        with open(compare, "r") as f:
+            baseline = json.loads(f.read())
+    results = {}
+    print(
+        format("benchmark", "<36")
+        + format("chars/s", ">12")
+        + format("p50 ms", ">10")
+        + format("p99 ms", ">10")
+        + format("peak KiB", ">10")
+        + ("  time vs baseline" if baseline else "")
+    )
+    for name, function, inputs in benchmarks(corpus()):
+        if only is not None and only not in name:
+            continue
+        bot.inline_checkpoints.clear()
+        result = results[name] = measure(function, inputs, repeat)
+        line = (
+            format(name, "<36")
+            + format(result["throughput"], ">12,.0f")
+            + format(result["p50"], ">10.3f")
+            + format(result["p99"], ">10.3f")
+            + format(result["peak_kib"], ">10.1f")
+        )
+        if name in baseline:
+            line += "  " + format(
+                baseline[name]["throughput"] / result["throughput"] - 1, "+.1%"
+            )
+        print(line)
+    if save is not None:
+        with open(save, "w") as f:
+            f.write(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks conversions, URL separation and handlers on a"
+        " fixed corpus"
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of times to run each benchmark over its corpus",
+    )
+    parser.add_argument(
+        "-k",
+        "--only",
+        default=None,
+        help="Only runs benchmarks whose name contains this",
+    )
+    parser.add_argument(
+        "--save",
+        default=None,
+        help="Saves the results as JSON to this file, to compare against later",
+    )
+    parser.add_argument(
+        "--compare",
+        default=None,
+        help="Compares the results with those saved to this file",
+    )
+    args = parser.parse_args()
+    main(args.repeat, args.only, args.save, args.compare)
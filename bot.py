@@ -1,141 +1,452 @@
+from __future__ import annotations
+
+import time
+
+# Set before anything else is imported, for --profile-startup
+import_started = time.perf_counter()
+
+import hashlib
 import logging
 import os
+import pickle
+import signal
+import sys
 import scriptcon
+import cache
 import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from telegram import Update
+    from telegram.ext import CallbackContext
+
+# A URL, without the whitespace character on either side of it that
+# url_separate() adds to it
+url_regex = re.compile(
+    r"((about|ftp(s)?|filesystem|git|ssh|http(s)?):(\/\/)?)?(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)"
+)
+# Every URL has a dot like this before its top level domain, at the end of a
+# run of host characters that starts at most url_prefix characters after the
+# URL does
+url_dot_regex = re.compile(r"\.(?=[a-zA-Z0-9()]{1,6}\b)")
+url_host_regex = re.compile(r"[-a-zA-Z0-9@:%._\+~#=]+")
+url_prefix = len("filesystem://www.")
+url_reach = url_prefix + 256
 
-try:
-    import ujson
+logger = logging.getLogger(__name__)
 
-    json = ujson
-except ModuleNotFoundError:
+
+def setup_logging(do_rich=True, debug=False):
+    """Configures logging, through rich when do_rich is set, rich is
+    installed and the log goes to a terminal."""
+    logging_args = {
+        "level": logging.DEBUG if debug else logging.INFO,
+        "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    }
+    if do_rich and sys.stderr.isatty():
+        try:
+            from rich.logging import RichHandler
+
+            logging_args["handlers"] = [RichHandler(rich_tracebacks=True)]
+        except ModuleNotFoundError:
+            pass
+    logging.basicConfig(**logging_args)
+
+
+def load_json(do_rich=False):
+    """Reads dict.json, generating it first if it is missing, and returns its
+    raw contents."""
     try:
-        import json
+        with open("dict.json", "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        print("ERROR: No dict.json found, attempting to make one")
+        try:
+            import dictgen
+
+            dictgen.main(do_rich)
+        except ModuleNotFoundError:
+            print("No dictgen.py found, unable to generate dict.json, exiting script")
+            exit()
+        with open("dict.json", "rb") as f:
+            return f.read()
+
+
+def load_schemes(do_rich=False):
+    """Returns the SHA-256 of the dict.json the schemes were compiled from
+    and the compiled schemes, from dict.pickle when it was compiled from the
+    current dict.json and from dict.json itself otherwise."""
+    started = time.perf_counter()
+    try:
+        with open("dict.pickle", "rb") as f:
+            digest, compiled = scriptcon.load(f.read())
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError) as error:
+        logger.warning("Not using dict.pickle: %s", error)
+        digest, compiled = None, None
+    try:
+        with open("dict.json", "rb") as f:
+            source = f.read()
+    except FileNotFoundError:
+        source = None
+    if compiled is not None and (
+        source is None or hashlib.sha256(source).hexdigest() == digest
+    ):
+        logger.info(
+            "Loaded dict.pickle in %.1f ms",
+            (time.perf_counter() - started) * 1000,
+        )
+        # dictgen.py compacted them before pickling them, and pickle keeps
+        # what they share
+        return digest, compiled
+    if compiled is not None:
+        logger.warning("dict.pickle is older than dict.json, not using it")
+    if source is None:
+        source = load_json(do_rich)
+    try:
+        import ujson as json
     except ModuleNotFoundError:
-        print("json module not found, can't read dict")
+        import json
+    dictdata = json.loads(source)
+    compiled = {name: scriptcon.compile(dictdata[name], name) for name in dictdata}
+    # Inverse schemes, inverted here for a dict.json made before they were added
+    for name in ("Cyrillic", "Katakana", "Lontara"):
+        if name + " inverse" not in compiled:
+            compiled[name + " inverse"] = scriptcon.compile(
+                scriptcon.invert(dictdata[name]), name + " inverse"
+            )
+    logger.info("Compiled dict.json in %.1f ms", (time.perf_counter() - started) * 1000)
+    return hashlib.sha256(source).hexdigest(), compact_schemes(compiled)
 
 
-from telegram import (
-    InlineQueryResultArticle,
-    ParseMode,
-    InputTextMessageContent,
-    Update,
-)
-from telegram.ext import (
-    Updater,
-    InlineQueryHandler,
-    CommandHandler,
-    CallbackContext,
-)
-from telegram.utils.helpers import escape_markdown
+def compact_schemes(compiled):
+    """Returns the schemes compacted with scriptcon.compact(), logging the
+    memory they take before and after when debugging, as measuring it takes
+    a few milliseconds."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return scriptcon.compact(compiled)
+    before = scriptcon.footprint(compiled)
+    compiled = scriptcon.compact(compiled)
+    after = scriptcon.footprint(compiled)
+    for name in compiled:
+        logger.debug(
+            "%s takes %d bytes, %d before compacting", name, after[name], before[name]
+        )
+    logger.debug(
+        "Schemes take %.1f KiB, %.1f KiB before compacting",
+        sum(after.values()) / 1024,
+        sum(before.values()) / 1024,
+    )
+    return compiled
 
-url_regex = re.compile(
-    r"\s?(((about|ftp(s)?|filesystem|git|ssh|http(s)?):(\/\/)?)?(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*)\s?)"
+
+# The schemes of each target by name: the one run on the text first and
+# those run on its result, with None for the result as it is
+target_schemes = {
+    name: ("Latin", (name,)) for name in ("Cyrillic", "Katakana", "Lontara")
+}
+target_schemes.update(
+    (name + " inverse", (None, (name + " inverse",)))
+    for name in ("Cyrillic", "Katakana", "Lontara")
 )
+# Inline queries are answered in every script, with the Latin pre-pass as is
+target_schemes["inline"] = ("Latin", ("Cyrillic", "Katakana", "Lontara", None))
 
-if __name__ == "__main__":
-    import argparse
-    import sys
+# Replaced all at once by install(), never modified
+schemes = {}
+targets = {}
+# The SHA-256 of the dict.json that the targets were built from
+version = None
+# The SHA-256 of the dict.json that the raw dictionaries of each target come
+# from and those dictionaries, for reference_convert(), replaced all at once
+references = (None, {})
 
-    parser = argparse.ArgumentParser(description="Runs TG bot")
-    parser.add_argument(
-        "-d",
-        "--debug",
-        action="store_true",
-        default=False,
-        help="Enabled Debugging mode",
-    )
-    if (sys.version_info[0] >= 3) and (sys.version_info[1] >= 9):
-        parser.add_argument(
-            "-r",
-            "--rich",
-            action=argparse.BooleanOptionalAction,
-            default=True,
-            help="Enables rich output",
-        )
-    else:
-        parser.add_argument(
-            "-r",
-            "--rich",
-            action="store_true",
-            default=True,
-            help="Enables rich output",
-        )
-        parser.add_argument(
-            "--no-rich",
-            action="store_false",
-            dest="rich",
-            help="Disables rich output",
+
+def load(do_rich=False):
+    """Loads the schemes and builds the targets from them, unless they are
+    loaded already."""
+    if targets:
+        return
+    install(*load_schemes(do_rich))
+
+
+def install(new_version, loaded, prepare=None):
+    """Builds the targets from compiled schemes and puts them in place of
+    the current ones. Conversions that already started finish with the
+    targets they started with. prepare is called, if set, once the new
+    targets are in place but before the new version is."""
+    global schemes, targets, version
+    empty = scriptcon.Scheme(())
+    # Each target is the scheme run on the text first and the fused schemes
+    built = {
+        target: (
+            loaded.get(prepass, empty),
+            scriptcon.fuse(tuple(loaded.get(name, empty) for name in names)),
         )
-    do_rich = parser.parse_args().rich
-    debug = parser.parse_args().debug
+        for target, (prepass, names) in target_schemes.items()
+    }
+    schemes = loaded
+    targets = built
+    if prepare is not None:
+        prepare()
+    # Set last, so that whoever sees the new version sees the new targets
+    version = new_version
+
+
+def reload(do_rich=False):
+    """Loads the schemes again if dict.json or dict.pickle changed, and
+    installs them, with new workers for the conversion_pool if there is
+    one."""
+    started = time.perf_counter()
+    new_version, loaded = load_schemes(do_rich)
+    if new_version == version:
+        logger.info("Dictionaries unchanged, version %s", version)
+        return
+    new_references = read_references(do_rich) if references[1] else None
+    old_pool = conversion_pool
+
+    def prepare():
+        global conversion_pool, references
+        # Along with the targets, so that the shadow_checker compares
+        # conversions with the new targets with the new references
+        if new_references is not None:
+            references = new_references
+        if old_pool is not None:
+            import pool
+
+            # Workers forked now start with the new targets if this module
+            # was imported as bot. Run as python bot.py, each worker imports
+            # bot afresh and so loads whatever dict.pickle or dict.json holds
+            # by then instead
+            conversion_pool = pool.ConversionPool(
+                old_pool.workers, old_pool.queue_size, old_pool.timeout
+            )
+
+    install(new_version, loaded, prepare)
+    # Whatever is cached was keyed by the old version, and only takes room
+    conversion_cache.clear()
+    inline_checkpoints.clear()
+    if old_pool is not None:
+        old_pool.shutdown()
+    logger.info(
+        "Reloaded dictionaries in %.1f ms, version %s",
+        (time.perf_counter() - started) * 1000,
+        new_version,
+    )
 
-if do_rich:
+
+def load_references(do_rich=False):
+    """Loads the dictionaries of the targets from dict.json for
+    reference_convert(), unless they are loaded already."""
+    global references
+    if references[1]:
+        return
+    references = read_references(do_rich)
+
+
+def read_references(do_rich=False) -> tuple:
+    """Returns the SHA-256 of dict.json and the dictionaries of the targets
+    from it."""
     try:
-        import rich
-        from rich.progress import track, Progress
-        from rich.logging import RichHandler
+        import ujson as json
     except ModuleNotFoundError:
-        do_rich = False
+        import json
+    source = load_json(do_rich)
+    dictdata = json.loads(source)
+    for name in ("Cyrillic", "Katakana", "Lontara"):
+        if name + " inverse" not in dictdata:
+            dictdata[name + " inverse"] = scriptcon.invert(dictdata[name])
+    return hashlib.sha256(source).hexdigest(), {
+        target: (
+            dictdata.get(prepass, []),
+            tuple(dictdata.get(name, []) for name in names),
+        )
+        for target, (prepass, names) in target_schemes.items()
+    }
 
-logging_args = {
-    "level": logging.DEBUG if debug else logging.INFO,
-    "format": "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-}
-if do_rich:
-    logging_args["handlers"] = [RichHandler(rich_tracebacks=True)]
-logging.basicConfig(**logging_args)
 
+# Resized by main() to the command line options
+conversion_cache = cache.LRUCache()
+# Checkpoints of the last inline query of recent users, to resume from. The
+# target they start with is shared, and not counted
+inline_checkpoints = cache.LRUCache(
+    1024, size=lambda checkpoints: cache.size_of(checkpoints[1:])
+)
+# Set by main() to drop inline queries that a newer one from the same user
+# superseded, when they are handled asynchronously
+inline_debouncer = None
+# Set by main() to convert in worker processes rather than on the dispatcher
+conversion_pool = None
+# What convert() raises when it had no room or time for a conversion, which
+# main() adds to along with the conversion_pool
+busy_errors = (TimeoutError,)
+# Set by main() to record what every stage of every conversion does
+stage_recorder = None
+# Set by main() to compare a sample of conversions with reference_convert()
+shadow_checker = None
+# Set by watch_dictionaries() to reload the dictionaries when they change
+dictionary_reloader = None
+# (index, number of shards) in a shard.ShardSupervisor worker
+current_shard = None
+# IDs of the chats and users that /stats answers, set by main()
+stats_operators = frozenset()
+# Most characters Telegram takes in a message
+message_limit = 4096
 
-try:
-    with open("dict.json", "r") as f:
-        dictdata = json.loads(f.read())
-except FileNotFoundError:
-    print("ERROR: No dict.json found, attempting to make one")
-    try:
-        import dictgen
 
-        dictgen.main(do_rich)
-    except ModuleNotFoundError:
-        print("No dictgen.py found, unable to generate dict.json, exiting script")
-        exit()
-    with open("dict.json", "r") as f:
-        dictdata = json.loads(f.read())
-
-
-def url_separate(text) -> tuple:
-    working_text = text
-    results = []
-    if url_regex.search(text) is not None:
-        while url_regex.search(working_text) is not None:
-            partitions = working_text.partition(url_regex.search(working_text).group(0))
-            results.append(partitions[0])
-            results.append(partitions[1])
-            working_text = partitions[2]
+def url_separate(text):
+    """Yields (is_url, slice) pairs splitting text into URLs, each with the
+    whitespace character on either side of it, and the text between them.
+
+    The text is scanned once. url_regex is only tried at the few positions
+    where a URL could start before each top level domain dot, so that a long
+    run of host characters costs at most url_reach attempts of at most
+    url_reach characters each instead of one attempt per character."""
+    copied = searched = 0
+    hosts = url_host_regex.finditer(text)
+    host = None
+    for dot in url_dot_regex.finditer(text):
+        if dot.start() < searched:
+            continue
+        # The dot is a host character, so some host run contains it
+        while host is None or host.end() <= dot.start():
+            host = next(hosts)
+        first = max(searched, host.start() - url_prefix, dot.start() - url_reach)
+        for position in range(first, dot.start()):
+            match = url_regex.match(text, position)
+            if match is not None:
+                break
         else:
-            results.append(working_text)
-        return tuple(results)
-    else:
-        return tuple([text])
+            searched = dot.start()
+            continue
+        begin, end = match.span()
+        if begin > copied and text[begin - 1].isspace():
+            begin -= 1
+        if end < len(text) and text[end].isspace():
+            end += 1
+        if begin > copied:
+            yield False, slice(copied, begin)
+        yield True, slice(begin, end)
+        copied = searched = end
+    if copied < len(text):
+        yield False, slice(copied, len(text))
 
 
 def start(update: Update, _: CallbackContext) -> None:
     update.message.reply_text("Ка̄ла!\nカーラ゚！\nᨀᨕᨒ!")
 
 
-def convert(text, dictionary) -> str:
-    result = ""
-    for x in url_separate(text):
-        if url_regex.match(x) is None:
-            result += scriptcon.convert(
-                scriptcon.convert(x, dictdata["Latin"]),
-                dictionary,
+def convert(text, target, checkpoints=None) -> tuple:
+    """Converts text with every scheme of one of the targets, leaving URLs as
+    they are, and returns one result per scheme.
+
+    checkpoints may be a list kept between calls for texts that tend to
+    extend each other, such as one user's inline queries. The conversion
+    picks up from it and replaces its contents with its own checkpoints.
+
+    With a conversion_pool, the conversion runs in a worker without
+    checkpoints and may raise any of busy_errors."""
+    # Loaded first, so that the key has the version of the targets used
+    load()
+    key = (version, target, text)
+    cached = conversion_cache.get(key)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
+    if conversion_pool is not None:
+        import pool
+
+        try:
+            results = conversion_pool.convert(text, target)
+        except pool.PoolClosed:
+            # A reload replaced the pool since this job took it
+            results = conversion_pool.convert(text, target)
+    else:
+        results = convert_uncached(text, target, checkpoints)
+    if shadow_checker is not None:
+        shadow_checker.check(
+            (text, target, key[0]), results, time.perf_counter() - started
+        )
+    conversion_cache.put(key, results)
+    return results
+
+
+def convert_uncached(text, target, checkpoints=None) -> tuple:
+    """convert() without the cache or the pool."""
+    load()
+    loaded = targets[target]
+    prepass, fused = loaded
+    results = tuple([] for _ in fused.schemes)
+    # Checkpoints only fit the target they were made with
+    previous = []
+    if checkpoints and checkpoints[0] is loaded:
+        previous = checkpoints[1:]
+    resumed = []
+    for is_url, segment in url_separate(text):
+        x = text[segment]
+        if is_url:
+            conversions = (x,) * len(results)
+        elif checkpoints is None:
+            conversions = fused.convert(prepass.convert(x), nfc=True)
+        else:
+            prepass_checkpoints, fused_checkpoints = (None, None)
+            if len(resumed) < len(previous):
+                prepass_checkpoints, fused_checkpoints = previous[len(resumed)]
+            prepassed, prepass_checkpoints = prepass.resume(x, prepass_checkpoints)
+            conversions, fused_checkpoints = fused.resume(
+                prepassed, fused_checkpoints, nfc=True
             )
+            resumed.append((prepass_checkpoints, fused_checkpoints))
+        for result, conversion in zip(results, conversions):
+            result.append(conversion)
+    if checkpoints is not None:
+        checkpoints[:] = [loaded] + resumed
+    return tuple("".join(result) for result in results)
+
+
+def reference_convert(text, target, expected_version=None) -> tuple:
+    """convert_uncached() with scriptcon.reference() rather than the compiled
+    schemes, which is much slower but says what convert() should return.
+
+    If expected_version is set and the dictionaries are not those of that
+    version, such as for a conversion made before a reload, shadow.Stale is
+    raised instead."""
+    load_references()
+    loaded_version, loaded = references
+    if expected_version is not None and expected_version != loaded_version:
+        import shadow
+
+        raise shadow.Stale("References are of version " + str(loaded_version))
+    prepass, dictionaries = loaded[target]
+    results = tuple([] for _ in dictionaries)
+    for is_url, segment in url_separate(text):
+        x = text[segment]
+        if is_url:
+            conversions = (x,) * len(results)
         else:
-            result += x
-    return result
+            x = scriptcon.reference(x, prepass)
+            conversions = [
+                scriptcon.reference(x, dictionary) for dictionary in dictionaries
+            ]
+        for result, conversion in zip(results, conversions):
+            result.append(conversion)
+    return tuple("".join(result) for result in results)
+
 
+def convert_stream(chunks, target):
+    """Like convert_uncached(), for text that comes as an iterable of chunks.
+    Yields one result per scheme for every piece of the text it cuts it
+    into, holding back no more than the text since the last whitespace
+    character that no stage looks at, such as a newline."""
+    load()
+    prepass, fused = targets[target]
+    # URLs never span whitespace, so they are never cut either
+    cuts = scriptcon.boundaries(prepass.stages + tuple(fused.stages()))
+    cuts = frozenset(char for char in cuts if char.isspace())
+    for piece in scriptcon.pieces(chunks, cuts):
+        yield convert_uncached(piece, target)
 
-def genfunc(dictionary):
+
+def genfunc(target):
     def function(update: Update, _: CallbackContext) -> None:
         if update.message.reply_to_message is not None:
             if update.message.reply_to_message.text is not None:
@@ -144,30 +455,50 @@ def genfunc(dictionary):
                 text = update.message.reply_to_message.caption
             else:
                 text = ""
-            update.message.reply_text(convert(text, dictionary))
+            try:
+                converted = convert(text, target)[0]
+            except busy_errors as error:
+                logger.warning("Not converting for /%s: %s", target, error)
+                update.message.reply_text("Too busy right now, try again later")
+                return
+            update.message.reply_text(converted)
 
     return function
 
 
 def inlinequery(update: Update, context: CallbackContext) -> None:
     """Handle the inline query."""
+    from telegram import InlineQueryResultArticle, InputTextMessageContent
+
     query = update.inline_query.query
-    cyrillicResult = ""
-    katakanaResult = ""
-    lontaraResult = ""
-    latinResult = ""
-    for x in url_separate(query):
-        if url_regex.match(x) is None:
-            latinConversion = scriptcon.convert(x, dictdata["Latin"])
-            latinResult += latinConversion
-            cyrillicResult += scriptcon.convert(latinConversion, dictdata["Cyrillic"])
-            katakanaResult += scriptcon.convert(latinConversion, dictdata["Katakana"])
-            lontaraResult += scriptcon.convert(latinConversion, dictdata["Lontara"])
-        else:
-            latinResult += x
-            cyrillicResult += x
-            katakanaResult += x
-            lontaraResult += x
+    user = update.inline_query.from_user.id
+    # Telegram sends a query for every keystroke, of which only the last
+    # one is worth converting and answering
+    debouncer = inline_debouncer
+    if debouncer is not None:
+        ticket = debouncer.arrive(user)
+        if not debouncer.wait(user, ticket):
+            return
+    checkpoints = inline_checkpoints.get(user)
+    if checkpoints is None:
+        checkpoints = []
+    try:
+        cyrillicResult, katakanaResult, lontaraResult, latinResult = convert(
+            query, "inline", checkpoints
+        )
+        # Put back once filled, so that the cache counts what they now hold
+        inline_checkpoints.put(user, checkpoints)
+    except busy_errors as error:
+        if debouncer is not None:
+            debouncer.abandon(user, ticket)
+        logger.warning("Not answering an inline query: %s", error)
+        return
+    except BaseException:
+        if debouncer is not None:
+            debouncer.abandon(user, ticket)
+        raise
+    if debouncer is not None and not debouncer.finish(user, ticket):
+        return
     results = [
         InlineQueryResultArticle(
             id=1,
@@ -198,21 +529,467 @@ def inlinequery(update: Update, context: CallbackContext) -> None:
     update.inline_query.answer(results, cache_time=30)
 
 
-def main() -> None:
-    token = os.environ["TG_TOKEN"]
-    updater = Updater(token, use_context=True)
-    dispatcher = updater.dispatcher
+def split_message(lines, limit=message_limit):
+    """Joins lines into as few messages of at most limit characters as it
+    can, cutting any line that is longer on its own."""
+    messages = []
+    for line in lines:
+        line = line[:limit]
+        if messages and len(messages[-1]) + 1 + len(line) <= limit:
+            messages[-1] += "\n" + line
+        else:
+            messages.append(line)
+    return messages
+
+
+def stats(update: Update, _: CallbackContext) -> None:
+    user = update.effective_user
+    if update.effective_chat.id not in stats_operators and (
+        user is None or user.id not in stats_operators
+    ):
+        logger.info("Not answering /stats in chat %d", update.effective_chat.id)
+        return
+    lines = []
+    if current_shard is not None:
+        lines.append("shard: " + str(current_shard[0]) + " of " + str(current_shard[1]))
+    lines += [
+        "cache_" + name + ": " + str(value)
+        for name, value in conversion_cache.stats().items()
+    ]
+    if inline_debouncer is not None:
+        lines += [
+            "inline_" + name + ": " + str(value)
+            for name, value in inline_debouncer.stats().items()
+        ]
+    if conversion_pool is not None:
+        lines += [
+            "pool_" + name + ": " + str(value)
+            for name, value in conversion_pool.stats().items()
+        ]
+    if shadow_checker is not None:
+        lines += [
+            "shadow_" + name + ": " + str(value)
+            for name, value in shadow_checker.stats().items()
+        ]
+    if stage_recorder is not None:
+        lines += stage_recorder.report()
+    for message in split_message(lines):
+        update.message.reply_text(message)
+
 
-    dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("cyrillic", genfunc(dictdata["Cyrillic"])))
-    dispatcher.add_handler(CommandHandler("katakana", genfunc(dictdata["Katakana"])))
-    dispatcher.add_handler(CommandHandler("lontara", genfunc(dictdata["Lontara"])))
+def add_handlers(dispatcher, run_async=False, inline_async=False):
+    """Adds the bot's handlers to a telegram.ext.Dispatcher, running them
+    asynchronously if run_async is set and inline queries if inline_async
+    is."""
+    from telegram.ext import InlineQueryHandler, CommandHandler
 
-    dispatcher.add_handler(InlineQueryHandler(inlinequery))
+    dispatcher.add_handler(CommandHandler("start", start, run_async=run_async))
+    dispatcher.add_handler(CommandHandler("stats", stats, run_async=run_async))
+    dispatcher.add_handler(
+        CommandHandler("cyrillic", genfunc("Cyrillic"), run_async=run_async)
+    )
+    dispatcher.add_handler(
+        CommandHandler("katakana", genfunc("Katakana"), run_async=run_async)
+    )
+    dispatcher.add_handler(
+        CommandHandler("lontara", genfunc("Lontara"), run_async=run_async)
+    )
+    dispatcher.add_handler(
+        CommandHandler("fromcyrillic", genfunc("Cyrillic inverse"), run_async=run_async)
+    )
+    dispatcher.add_handler(
+        CommandHandler("fromkatakana", genfunc("Katakana inverse"), run_async=run_async)
+    )
+    dispatcher.add_handler(
+        CommandHandler("fromlontara", genfunc("Lontara inverse"), run_async=run_async)
+    )
 
-    updater.start_polling()
-    updater.idle()
+    dispatcher.add_handler(InlineQueryHandler(inlinequery, run_async=inline_async))
+
+
+def watch_dictionaries(interval, forward=None):
+    """Reloads the dictionaries in the background on SIGHUP, and whenever
+    dict.json or dict.pickle is modified if interval, the seconds between
+    checks, is not 0. forward is also called with the signal if set."""
+    global dictionary_reloader
+    import reloader
+
+    dictionary_reloader = reloader.Reloader(
+        reload, ("dict.json", "dict.pickle"), interval
+    )
+    if not hasattr(signal, "SIGHUP"):
+        return
+
+    def hangup(signum, _):
+        dictionary_reloader.request()
+        if forward is not None:
+            forward(signum)
+
+    signal.signal(signal.SIGHUP, hangup)
+
+
+def shard_dispatcher(
+    index, shards, token, base_url, workers, run_async, inline_async, reload_interval
+):
+    """Returns a telegram.ext.Dispatcher with the bot's handlers for the
+    worker that handles shard index of shards."""
+    global current_shard, shadow_checker
+    from telegram import Bot
+    from telegram.ext import Dispatcher
+    from telegram.utils.request import Request
+
+    current_shard = (index, shards)
+    # Neither thread was forked along with this process
+    watch_dictionaries(reload_interval)
+    if shadow_checker is not None:
+        import shadow
+
+        shadow_checker = shadow.Shadow(reference_convert, shadow_checker.fraction)
+    bot = Bot(token, base_url=base_url, request=Request(con_pool_size=workers + 4))
+    dispatcher = Dispatcher(bot, None, workers=workers)
+    add_handlers(dispatcher, run_async, inline_async)
+    return dispatcher
+
+
+def main(
+    do_rich=True,
+    debug=False,
+    cache_entries=4096,
+    cache_bytes=16 * 1024 * 1024,
+    profile_startup=False,
+    workers=0,
+    queue_size=None,
+    job_timeout=10.0,
+    webhook=False,
+    listen="127.0.0.1",
+    port=8443,
+    webhook_path="",
+    cert=None,
+    key=None,
+    webhook_url=None,
+    base_url=None,
+    instrument_stages=False,
+    inline_window=0.0,
+    shards=0,
+    shadow_fraction=0.0,
+    reload_interval=0.0,
+    operators=(),
+) -> None:
+    global conversion_cache, conversion_pool, stage_recorder, inline_debouncer
+    global shadow_checker, stats_operators, busy_errors
+    phases = [("import bot", time.perf_counter() - import_started)]
+
+    def phase(name, started):
+        phases.append((name, time.perf_counter() - started))
+        return time.perf_counter()
+
+    started = time.perf_counter()
+    setup_logging(do_rich, debug)
+    started = phase("logging", started)
+    from telegram.ext import Updater
+
+    started = phase("import telegram", started)
+    load(do_rich)
+    conversion_cache = cache.LRUCache(cache_entries, cache_bytes)
+    started = phase("load dictionaries", started)
+    if shadow_fraction:
+        import shadow
+
+        load_references(do_rich)
+        shadow_checker = shadow.Shadow(reference_convert, shadow_fraction)
+        started = phase("load references", started)
+    if instrument_stages:
+        import instrument
+
+        stage_recorder = instrument.StageRecorder()
+        scriptcon.set_recorder(stage_recorder)
+    if workers:
+        import pool
+
+        conversion_pool = pool.ConversionPool(workers, queue_size, job_timeout)
+        # A job can find the pool shut down again by a second reload
+        busy_errors = (pool.PoolBusy, pool.PoolClosed, TimeoutError)
+        started = phase("start workers", started)
+    # Along with any in TG_OPERATORS, separated by commas
+    stats_operators = frozenset(operators) | frozenset(
+        int(operator)
+        for operator in os.environ.get("TG_OPERATORS", "").split(",")
+        if operator.strip()
+    )
+
+    if profile_startup:
+        # Nothing is sent to Telegram, and the Updater is still built as it
+        # would be, so any well-formed token will do
+        token = os.environ.get("TG_TOKEN", "123:profile")
+    else:
+        token = os.environ["TG_TOKEN"]
+    updater_args = {"use_context": True, "base_url": base_url}
+    if conversion_pool is not None:
+        # Handlers wait on the pool in the dispatcher's worker threads, so
+        # that there are enough of them to keep the queue full
+        updater_args["workers"] = conversion_pool.queue_size
+    if inline_window:
+        # Each user's latest inline query waits out the window in one of the
+        # dispatcher's worker threads
+        updater_args["workers"] = max(updater_args.get("workers", 4), 32)
+    updater = Updater(token, **updater_args)
+    run_async = conversion_pool is not None
+    inline_async = run_async or bool(inline_window)
+    if inline_async:
+        import debounce
+
+        # Inline queries handled at once could be answered out of order
+        inline_debouncer = debounce.Debouncer(inline_window)
+    supervisor = None
+    if shards:
+        import functools
+        import shard
+        from telegram import Update
+        from telegram.ext import TypeHandler
+
+        # This process only receives updates, and hands them to workers
+        # forked now that the schemes are loaded
+        supervisor = shard.ShardSupervisor(
+            shards,
+            functools.partial(
+                shard_dispatcher,
+                shards=shards,
+                token=token,
+                base_url=base_url,
+                workers=updater_args.get("workers", 4),
+                run_async=run_async,
+                inline_async=inline_async,
+                reload_interval=reload_interval,
+            ),
+        )
+        updater.dispatcher.add_handler(TypeHandler(Update, supervisor.dispatch))
+        started = phase("start shards", started)
+    else:
+        add_handlers(updater.dispatcher, run_async, inline_async)
+    # Forked shards watch the dictionaries themselves, but are told of
+    # SIGHUP by this process
+    watch_dictionaries(
+        reload_interval, supervisor.signal if supervisor is not None else None
+    )
+    phase("register handlers", started)
+
+    if profile_startup:
+        for name, seconds in phases:
+            print(name + ": " + format(seconds * 1000, ".1f") + " ms")
+        print("total: " + format(sum(s for _, s in phases) * 1000, ".1f") + " ms")
+    elif webhook:
+        # Sets the webhook to webhook_url, uploading cert if there is one.
+        # Telegram could not reach one made from listen, such as 0.0.0.0
+        if webhook_url is None:
+            raise ValueError("A webhook needs the public URL to set it to")
+        updater.start_webhook(
+            listen=listen,
+            port=port,
+            url_path=webhook_path,
+            cert=cert,
+            key=key,
+            webhook_url=webhook_url,
+        )
+        updater.idle()
+    else:
+        updater.start_polling()
+        updater.idle()
+    if conversion_pool is not None:
+        conversion_pool.shutdown()
+    if supervisor is not None:
+        supervisor.stop()
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Runs TG bot")
+    parser.add_argument(
+        "-d",
+        "--debug",
+        action="store_true",
+        default=False,
+        help="Enabled Debugging mode",
+    )
+    if (sys.version_info[0] >= 3) and (sys.version_info[1] >= 9):
+        parser.add_argument(
+            "-r",
+            "--rich",
+            action=argparse.BooleanOptionalAction,
+            default=True,
+            help="Enables rich output",
+        )
+    else:
+        parser.add_argument(
+            "-r",
+            "--rich",
+            action="store_true",
+            default=True,
+            help="Enables rich output",
+        )
+        parser.add_argument(
+            "--no-rich",
+            action="store_false",
+            dest="rich",
+            help="Disables rich output",
+        )
+    parser.add_argument(
+        "--cache-entries",
+        type=int,
+        default=4096,
+        help="Maximum number of cached conversions, 0 disables the cache",
+    )
+    parser.add_argument(
+        "--cache-bytes",
+        type=int,
+        default=16 * 1024 * 1024,
+        help="Maximum size of the conversion cache in bytes",
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        default=False,
+        help="Prints how long each phase of startup takes and exits",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of worker processes to convert in, 0 converts on the"
+        " dispatcher threads",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=None,
+        help="Maximum number of conversions queued or running in the workers,"
+        " 4 per worker by default",
+    )
+    parser.add_argument(
+        "--job-timeout",
+        type=float,
+        default=10.0,
+        help="Seconds a conversion may wait for room in the queue, and then"
+        " for a worker",
+    )
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        default=False,
+        help="Receives updates through a webhook instead of polling for them",
+    )
+    parser.add_argument(
+        "--listen",
+        default="127.0.0.1",
+        help="Address the webhook listens on",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8443,
+        help="Port the webhook listens on",
+    )
+    parser.add_argument(
+        "--webhook-path",
+        default="",
+        help="URL path the webhook listens on, such as a secret string",
+    )
+    parser.add_argument(
+        "--cert",
+        default=None,
+        help="TLS certificate for the webhook to serve and upload to Telegram",
+    )
+    parser.add_argument(
+        "--key",
+        default=None,
+        help="Private key of the TLS certificate",
+    )
+    parser.add_argument(
+        "--webhook-url",
+        default=None,
+        help="Public URL that Telegram reaches the listener at, directly or"
+        " through a reverse proxy. Required with --webhook",
+    )
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="Bot API URL to use instead of Telegram's, such as that of a local"
+        " Bot API server or of a stand-in for testing",
+    )
+    parser.add_argument(
+        "--instrument",
+        action="store_true",
+        default=False,
+        help="Records the time, replacements and lengths of every stage of"
+        " every conversion, for /stats to show. Not in --workers processes",
+    )
+    parser.add_argument(
+        "--inline-window",
+        type=float,
+        default=0.0,
+        help="Seconds an inline query waits for a newer one from the same user"
+        " before it is converted. Queries superseded before they are answered"
+        " are dropped either way",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=0,
+        help="Number of processes to fork after loading the dictionaries, to"
+        " handle updates received by this one. 0 handles them here",
+    )
+    parser.add_argument(
+        "--shadow",
+        type=float,
+        default=0.0,
+        metavar="FRACTION",
+        help="Fraction of conversions to also run through the reference"
+        " implementation in the background, logging any that differ",
+    )
+    parser.add_argument(
+        "--reload-interval",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="Checks dict.json and dict.pickle for changes this often and"
+        " reloads them when they change, as SIGHUP always does. 0 only"
+        " reloads on SIGHUP",
+    )
+    parser.add_argument(
+        "--operator",
+        type=int,
+        action="append",
+        default=[],
+        metavar="ID",
+        help="ID of a chat or user that /stats answers, which can be given"
+        " more than once or in TG_OPERATORS. /stats answers no one otherwise",
+    )
+    args = parser.parse_args()
+    if args.webhook and args.webhook_url is None:
+        parser.error("--webhook needs --webhook-url")
+    if args.shards and args.workers:
+        parser.error("--shards and --workers can't be combined")
+    main(
+        do_rich=args.rich,
+        debug=args.debug,
+        cache_entries=args.cache_entries,
+        cache_bytes=args.cache_bytes,
+        profile_startup=args.profile_startup,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        job_timeout=args.job_timeout,
+        webhook=args.webhook,
+        listen=args.listen,
+        port=args.port,
+        webhook_path=args.webhook_path,
+        cert=args.cert,
+        key=args.key,
+        webhook_url=args.webhook_url,
+        base_url=args.base_url,
+        instrument_stages=args.instrument,
+        inline_window=args.inline_window,
+        shards=args.shards,
+        shadow_fraction=args.shadow,
+        reload_interval=args.reload_interval,
+        operators=args.operator,
+    )
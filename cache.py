@@ -0,0 +1,83 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def size_of(value, seen=None):
+    """Approximate memory held by a cache key or value, in bytes, with what
+    the tuples and lists in it hold. Objects held more than once are counted
+    once."""
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(size_of(item, seen) for item in value)
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """A thread-safe least recently used cache, bounded both by its number
+    of entries and by the approximate size of its keys and values.
+
+    A max_entries or max_bytes of 0 disables caching, but lookups are still
+    counted. size, if set, is called with each value instead of size_of().
+    A value changed in place after put() is only measured again by another
+    put()."""
+
+    def __init__(self, max_entries=4096, max_bytes=16 * 1024 * 1024, size=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = size or size_of
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = size_of(key) + self.size(value)
+        if size > self.max_bytes or not self.max_entries:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
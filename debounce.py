@@ -0,0 +1,69 @@
+import itertools
+import threading
+import time
+
+
+class Debouncer:
+    """Keeps track of the latest call for each key, such as a user's inline
+    queries, so that work for calls that a newer one superseded can be
+    dropped.
+
+    A call starts with arrive(), which returns its ticket. wait() holds it
+    up to window seconds for a newer call to supersede it, and finish()
+    tells whether it is still the latest once its work is done, and so
+    whether its result is worth delivering. Each call is counted as either
+    answered or dropped."""
+
+    def __init__(self, window=0.0):
+        self.window = window
+        self._tickets = itertools.count(1)
+        self._latest = {}
+        self._changed = threading.Condition()
+        self.answered = 0
+        self.dropped = 0
+
+    def arrive(self, key) -> int:
+        with self._changed:
+            ticket = self._latest[key] = next(self._tickets)
+            self._changed.notify_all()
+        return ticket
+
+    def wait(self, key, ticket) -> bool:
+        """Waits until window seconds have passed since the call arrived
+        without a newer one for key, and returns True, or returns False as
+        soon as a newer one arrives, counting the call as dropped."""
+        deadline = time.monotonic() + self.window
+        with self._changed:
+            while self._latest.get(key, 0) == ticket:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return True
+                self._changed.wait(left)
+            self.dropped += 1
+            return False
+
+    def finish(self, key, ticket) -> bool:
+        """Returns whether the call is still the latest for key, counting it
+        as answered if so and as dropped otherwise."""
+        with self._changed:
+            if self._latest.get(key, 0) != ticket:
+                self.dropped += 1
+                return False
+            del self._latest[key]
+            self.answered += 1
+            return True
+
+    def abandon(self, key, ticket):
+        """Forgets a call whose work failed, without counting it."""
+        with self._changed:
+            if self._latest.get(key, 0) == ticket:
+                del self._latest[key]
+
+    def stats(self) -> dict:
+        with self._changed:
+            return {
+                "window": self.window,
+                "pending": len(self._latest),
+                "answered": self.answered,
+                "dropped": self.dropped,
+            }
@@ -1,4 +1,9 @@
-def main(do_rich=True):
+# Version of gendict(), to be raised whenever what it generates from the same
+# subdicts changes, so that schemes reused from the last run are built again
+GENERATOR_VERSION = 1
+
+
+def main(do_rich=True, force=False):
     if do_rich:
         try:
             import rich
@@ -16,8 +21,26 @@ def main(do_rich=True):
         except ModuleNotFoundError:
             print("json module not found, can't output")
 
+    import hashlib
+    import os
+    import pickle
+    import time
     import unicodedata
 
+    import scriptcon
+
+    def write(path, content):
+        """Replaces path with content at once, so that a run that is
+        interrupted, or a bot reloading meanwhile, never sees half of it."""
+        temporary = path + ".tmp"
+        if isinstance(content, str):
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(content)
+        else:
+            with open(temporary, "wb") as f:
+                f.write(content)
+        os.replace(temporary, path)
+
     def conditional_track(sequence, text):
         if do_rich:
             return track(sequence=sequence, description=text)
@@ -80,7 +103,71 @@ def main(do_rich=True):
 
         return dict
 
+    # What the last run generated, to reuse for schemes whose sources and
+    # options have not changed since
+    old_data, old_hashes, old_schemes = {}, {}, {}
+    if not force:
+        try:
+            with open("dict.json", "r", encoding="utf-8") as f:
+                old_out = f.read()
+            old_data = json.loads(old_out)
+        except (OSError, ValueError):
+            old_out, old_data = None, {}
+        # Without the hashes every scheme is built again, but dict.json and
+        # dict.pickle are still left alone if that changes nothing in them
+        try:
+            with open("dict.hashes.json", "r") as f:
+                old_hashes = json.loads(f.read())
+        except (OSError, ValueError):
+            old_hashes = {}
+        try:
+            with open("dict.pickle", "rb") as f:
+                old_digest, old_schemes = scriptcon.load(f.read())
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            old_digest = None
+        if (
+            old_out is None
+            or old_digest != hashlib.sha256(old_out.encode()).hexdigest()
+        ):
+            # Compiled from some other dict.json
+            old_digest, old_schemes = None, {}
+    else:
+        old_out = old_digest = None
+
     data = {}
+    hashes = {}
+    rebuilt = set()
+
+    def build(name, subdicts, inverse=False):
+        """Generates a scheme into data with gendict, and its inverse too if
+        inverse is set, unless its subdicts, and the versions of what
+        generates them, are the same as last time."""
+        started = time.perf_counter()
+        names = [name, name + " inverse"] if inverse else [name]
+        hashes[name] = hashlib.sha256(
+            json.dumps(
+                [GENERATOR_VERSION, scriptcon.INVERT_VERSION if inverse else None]
+                + [subdicts],
+                sort_keys=True,
+                ensure_ascii=False,
+            ).encode()
+        ).hexdigest()
+        if old_hashes.get(name) == hashes[name] and all(n in old_data for n in names):
+            for n in names:
+                data[n] = old_data[n]
+            print(name + ": unchanged")
+            return
+        data[name] = gendict(subdicts)
+        if inverse:
+            # For converting back into Latin
+            data[name + " inverse"] = scriptcon.invert(data[name])
+        rebuilt.update(names)
+        print(
+            name
+            + ": built in "
+            + format((time.perf_counter() - started) * 1000, ".1f")
+            + " ms"
+        )
 
     latin0 = {
         "\\AE": "Æ",
@@ -96,7 +183,7 @@ def main(do_rich=True):
         latin1["\=" + vowel] = unicodedata.normalize("NFC", vowel + "̄")
         latin1["\=" + vowel.upper()] = unicodedata.normalize("NFC", vowel.upper() + "̄")
 
-    data["Latin"] = gendict([{"data": latin0}, {"data": latin1}])
+    build("Latin", [{"data": latin0}, {"data": latin1}])
 
     cyrillic = {
         "pf": "ԥ",
@@ -159,7 +246,8 @@ def main(do_rich=True):
     cyrillic["nG"] = "ҥ"
     cyrillic["Ng"] = "Ҥ"
 
-    data["Cyrillic"] = gendict(
+    build(
+        "Cyrillic",
         [
             {"decomposed": True, "data": cyrillic},
             {
@@ -184,7 +272,8 @@ def main(do_rich=True):
                     "repl": r"\1'\2",
                 },
             },
-        ]
+        ],
+        inverse=True,
     )
 
     katakana0 = {}
@@ -400,7 +489,8 @@ def main(do_rich=True):
             if a[0] in b:
                 katakana2[b.replace(a[0], a[1])] = katakana2[b]
 
-    data["Katakana"] = gendict(
+    build(
+        "Katakana",
         [
             {"caps_insensitive": True, "data": katakana0},
             {"reverse": True, "caps_insensitive": True, "data": katakana1},
@@ -449,7 +539,8 @@ def main(do_rich=True):
                     "repl": r"\1'\2",
                 },
             },
-        ]
+        ],
+        inverse=True,
     )
 
     # Lontara Dict Generator
@@ -502,7 +593,8 @@ def main(do_rich=True):
             if a[0] in b:
                 lontara1[b.replace(a[0], a[1])] = lontara1[b]
 
-    data["Lontara"] = gendict(
+    build(
+        "Lontara",
         [
             {"caps_insensitive": True, "data": lontara0},
             {"caps_insensitive": True, "data": lontara1},
@@ -539,12 +631,33 @@ def main(do_rich=True):
                     "repl": r"\1'\2",
                 },
             },
-        ]
+        ],
+        inverse=True,
     )
 
     out = json.dumps(data, indent=4, ensure_ascii=False)
-    with open("dict.json", "w") as f:
-        f.write(out)
+    # Left alone when unchanged, so that nothing watching them reloads
+    if out != old_out:
+        write("dict.json", out)
+    else:
+        print("dict.json: unchanged")
+    if hashes != old_hashes:
+        write("dict.hashes.json", json.dumps(hashes, indent=4))
+
+    # The compiled schemes, for bot.py to load without compiling them
+    digest = hashlib.sha256(out.encode()).hexdigest()
+    if digest != old_digest:
+        schemes = {
+            name: (
+                old_schemes[name]
+                if name in old_schemes and name not in rebuilt
+                else scriptcon.compile(data[name], name)
+            )
+            for name in data
+        }
+        write("dict.pickle", scriptcon.dump(scriptcon.compact(schemes), digest))
+    else:
+        print("dict.pickle: unchanged")
 
 
 if __name__ == "__main__":
@@ -574,6 +687,14 @@ if __name__ == "__main__":
             dest="rich",
             help="Disables rich output",
         )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        default=False,
+        help="Rebuilds every scheme, even those that have not changed",
+    )
     rich_enable = parser.parse_args().rich
+    force = parser.parse_args().force
 
-    main(rich_enable)
+    main(rich_enable, force)
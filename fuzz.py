@@ -0,0 +1,209 @@
+import argparse
+import json
+import random
+import re
+import unicodedata
+
+import scriptcon
+from benchmark import consonants, vowels
+
+extras = (" ", " ", "\n", ".", ",", "!", "'", "-", "=", "\\", "ー", "ン", "İ", "Σ")
+# Combining marks, voicing marks and jamo, which normalisation composes with
+# what comes before them, for --normal-forms
+marks = ("\u0301", "\u0304", "\u0306", "\u0308", "\u0323", "\u0332", "\u3099")
+marks += ("\u309a", "\u1100", "\u1161", "\u11a8", "\uac00")
+# Dictionaries checked along with those in dict.json, with regex stages
+# whose replacements compose with the text around them
+composing = {
+    "composing regex": [
+        {"type": "regex", "params": {"pattern": "x", "repl": "\u0301"}},
+        {"type": "regex", "params": {"pattern": "é", "repl": "E"}},
+    ],
+    "composing regex, decomposed": [
+        {"type": "regex", "params": {"pattern": "q", "repl": "\u3099"}},
+        {"type": "regex", "params": {"pattern": "が", "repl": "ga"}},
+        {"type": "regex", "params": {"pattern": "y", "repl": "\u0304"}},
+    ],
+}
+
+
+def texts(rng, dictdata, count, max_length, marked=False):
+    """Yields count random texts, mostly of Kxel-like syllables mixed with
+    the keys and replacements of every dictionary, and now and then with
+    any character, in capitals or decomposed. With marked, a third of what
+    they are made of is combining marks, and they are often in NFD or
+    NFKC."""
+    pieces = set()
+    for dictionary in dictdata.values():
+        for subdict in dictionary:
+            for table in (subdict.get("data", {}), subdict.get("aliases", {})):
+                pieces.update(table)
+                pieces.update(table.values())
+            # And what regex subdicts match and make, where that is literal
+            params = subdict.get("params", {})
+            pieces.update(
+                value
+                for value in (params.get("pattern"), params.get("repl"))
+                if value and re.escape(value) == value
+            )
+    pieces = sorted(piece for piece in pieces if piece)
+    for _ in range(count):
+        text = []
+        length = rng.randint(0, max_length)
+        while len("".join(text)) < length:
+            roll = rng.random()
+            if marked and rng.random() < 0.3:
+                text.append(rng.choice(marks))
+            elif roll < 0.5:
+                text.append(rng.choice(consonants + ("",)) + rng.choice(vowels))
+            elif roll < 0.8:
+                text.append(rng.choice(pieces))
+            elif roll < 0.95:
+                text.append(rng.choice(extras))
+            else:
+                text.append(chr(rng.randrange(0x20, 0x3100)))
+            if rng.random() < 0.1:
+                text[-1] = text[-1].upper()
+        text = "".join(text)[:length]
+        if marked and rng.random() < 0.5:
+            text = unicodedata.normalize(rng.choice(("NFD", "NFKC")), text)
+        elif rng.random() < 0.1:
+            text = unicodedata.normalize("NFD", text)
+        yield text
+
+
+def normalizing(scheme):
+    """Returns scheme with every stage normalising the text it is given,
+    rather than relying on the normal form the stage before left it in, and
+    with fused regex stages split up again."""
+    stages = []
+    for stage in scheme.stages:
+        if isinstance(stage, scriptcon.RegexSetStage):
+            stages += stage.stages
+        else:
+            stages.append(stage)
+    return scheme._replace(
+        stages=tuple(stage._replace(keeps_form=False) for stage in stages)
+    )
+
+
+def main(
+    dict_path="dict.json",
+    count=2000,
+    max_length=40,
+    seed=None,
+    verbose=False,
+    normal_forms=False,
+):
+    """Checks that the compiled schemes of every dictionary in dict_path,
+    with and without resuming and fused together, convert random texts the
+    same as scriptcon.reference(), or, with normal_forms, the same as when
+    every stage normalises its text, on texts heavy with combining marks.
+    Returns the number of mismatches."""
+    with open(dict_path, "rb") as f:
+        dictdata = json.loads(f.read())
+    dictdata.update(composing)
+    compiled = {name: scriptcon.compile(dictdata[name], name) for name in dictdata}
+    names = list(compiled)
+    if normal_forms:
+        normalizing_schemes = {name: normalizing(compiled[name]) for name in names}
+    fused = scriptcon.fuse(tuple(compiled[name] for name in names))
+    if seed is None:
+        seed = random.randrange(1 << 32)
+    print("seed " + str(seed))
+    rng = random.Random(seed)
+    mismatches = 0
+
+    def compare(how, name, text, result, expected):
+        nonlocal mismatches
+        if result != expected:
+            mismatches += 1
+            print(how + " " + name + " " + repr(text))
+            print("  got      " + repr(result))
+            print("  expected " + repr(expected))
+
+    checkpoints = dict.fromkeys(names)
+    for text in texts(rng, dictdata, count, max_length, normal_forms):
+        if normal_forms:
+            expected = [normalizing_schemes[name].convert(text) for name in names]
+        else:
+            expected = [scriptcon.reference(text, dictdata[name]) for name in names]
+        for name, reference in zip(names, expected):
+            compare("convert", name, text, compiled[name].convert(text), reference)
+            # Resuming from the checkpoints of the last text, as inline
+            # queries do
+            result, checkpoints[name] = compiled[name].resume(text, checkpoints[name])
+            compare("resume", name, text, result, reference)
+            if verbose:
+                print(name + " " + repr(text) + " -> " + repr(reference))
+        for name, result, reference in zip(names, fused.convert(text), expected):
+            compare("fused", name, text, result, reference)
+    print(
+        str(count)
+        + " texts, "
+        + str(len(names))
+        + " schemes, "
+        + str(mismatches)
+        + " mismatches"
+    )
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compares the compiled schemes with the reference"
+        " implementation on random text"
+    )
+    parser.add_argument(
+        "-d",
+        "--dict",
+        default="dict.json",
+        help="dict.json to take the schemes from",
+    )
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        default=2000,
+        help="Number of random texts to convert",
+    )
+    parser.add_argument(
+        "--max-length",
+        type=int,
+        default=40,
+        help="Length of the longest random text",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Seed to generate the same texts as an earlier run",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="Prints every conversion",
+    )
+    parser.add_argument(
+        "--normal-forms",
+        action="store_true",
+        default=False,
+        help="Compares with the compiled schemes normalising the text at"
+        " every stage instead of with the reference, on text heavy with"
+        " combining marks",
+    )
+    args = parser.parse_args()
+    exit(
+        1
+        if main(
+            args.dict,
+            args.count,
+            args.max_length,
+            args.seed,
+            args.verbose,
+            args.normal_forms,
+        )
+        else 0
+    )
@@ -0,0 +1,107 @@
+import threading
+
+
+class Histogram:
+    """Counts non-negative values in buckets bounded by powers of two, so
+    that it takes the same little memory however many values it counts."""
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+
+    def add(self, value):
+        # Bucket b holds the values from 2 ** (b - 1) up to 2 ** b
+        bucket = int(value).bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, fraction):
+        """Returns an upper bound for the given quantile of the values."""
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return (1 << bucket) - 1
+        return 0
+
+
+class StageRecorder:
+    """Aggregates what scriptcon hands to it when set with
+    scriptcon.set_recorder() into histograms per scheme and stage."""
+
+    fields = ("microseconds", "replacements", "iterations", "input", "output")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def __call__(
+        self,
+        scheme,
+        index,
+        seconds,
+        replacements,
+        iterations,
+        input_length,
+        output_length,
+    ):
+        values = (
+            seconds * 1000000,
+            replacements,
+            iterations,
+            input_length,
+            output_length,
+        )
+        with self._lock:
+            histograms = self.stages.get((scheme, index))
+            if histograms is None:
+                histograms = self.stages[(scheme, index)] = {
+                    field: Histogram() for field in self.fields
+                }
+            for field, value in zip(self.fields, values):
+                histograms[field].add(value)
+
+    def clear(self):
+        with self._lock:
+            self.stages.clear()
+
+    def report(self) -> list:
+        """Returns a line for every stage, the one that took longest in all
+        first. Stages that never replaced anything are marked as dead."""
+        with self._lock:
+            stages = sorted(
+                self.stages.items(),
+                key=lambda item: item[1]["microseconds"].total,
+                reverse=True,
+            )
+            lines = []
+            for (scheme, index), histograms in stages:
+                timing = histograms["microseconds"]
+                line = (
+                    str(scheme)
+                    + "["
+                    + str(index)
+                    + "]: "
+                    + str(timing.count)
+                    + " calls, "
+                    + format(timing.total / 1000, ".1f")
+                    + " ms, p50 < "
+                    + str(timing.quantile(0.5) + 1)
+                    + " µs, p99 < "
+                    + str(timing.quantile(0.99) + 1)
+                    + " µs, "
+                    + str(histograms["replacements"].total)
+                    + " replacements, "
+                    + str(histograms["iterations"].total)
+                    + " substitutions, "
+                    + str(histograms["input"].total)
+                    + " -> "
+                    + str(histograms["output"].total)
+                    + " chars"
+                )
+                if not histograms["replacements"].total:
+                    line += " (dead)"
+                lines.append(line)
+            return lines
@@ -0,0 +1,110 @@
+import threading
+from concurrent import futures
+
+
+class PoolBusy(Exception):
+    """Raised when a job waited too long for room in a ConversionPool."""
+
+
+class PoolClosed(RuntimeError):
+    """Raised when a job is given to a ConversionPool after shutdown()."""
+
+
+def _initialize():
+    import bot
+
+    bot.load()
+
+
+def _ready():
+    return True
+
+
+def _convert(text, target):
+    import bot
+
+    return bot.convert_uncached(text, target)
+
+
+class ConversionPool:
+    """Runs bot conversions in worker processes, each of which loads the
+    schemes once when it starts.
+
+    At most queue_size jobs are submitted or running at a time. A job that
+    finds no room waits up to timeout seconds for some and raises PoolBusy
+    after that, and a submitted job that takes longer than timeout seconds
+    raises TimeoutError, although it keeps its worker busy until it ends.
+
+    shutdown() lets the jobs of callers that are already waiting for room or
+    for their result finish, and only stops the workers after them."""
+
+    def __init__(self, workers, queue_size=None, timeout=10.0):
+        self.workers = workers
+        self.queue_size = queue_size or 4 * workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+        self._executor = futures.ProcessPoolExecutor(workers, initializer=_initialize)
+        self.submitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        # Callers in convert(), and whether shutdown() was called
+        self._callers = 0
+        self._closing = False
+        # Starts the workers now rather than on the first conversions
+        for future in [self._executor.submit(_ready) for _ in range(workers)]:
+            future.result()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def convert(self, text, target) -> tuple:
+        """Returns bot.convert_uncached(text, target) from a worker."""
+        with self._lock:
+            if self._closing:
+                raise PoolClosed("Pool is shut down")
+            self._callers += 1
+        try:
+            return self._convert(text, target)
+        finally:
+            with self._lock:
+                self._callers -= 1
+                last = self._closing and not self._callers
+            if last:
+                self._executor.shutdown(wait=False)
+
+    def _convert(self, text, target):
+        if not self._slots.acquire(timeout=self.timeout):
+            self._count("rejected")
+            raise PoolBusy("No room for a job after " + str(self.timeout) + " s")
+        try:
+            future = self._executor.submit(_convert, text, target)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._count("submitted")
+        try:
+            return future.result(self.timeout)
+        except futures.TimeoutError:
+            future.cancel()
+            self._count("timeouts")
+            raise TimeoutError("Job took over " + str(self.timeout) + " s")
+
+    def shutdown(self):
+        with self._lock:
+            self._closing = True
+            idle = not self._callers
+        if idle:
+            self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+            }
@@ -0,0 +1,58 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def _mtimes(paths):
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+class Reloader:
+    """Calls reload() in a thread of its own when request() is called, such
+    as from a signal handler, and, unless interval is 0, when any of paths
+    was modified, which it checks every interval seconds.
+
+    Requests made while reload() runs are served by a single call after it,
+    and an exception raised by reload() is logged and leaves the reloader
+    waiting for the next change."""
+
+    def __init__(self, reload, paths, interval=0.0):
+        self.reload = reload
+        self.paths = tuple(paths)
+        self.interval = interval
+        self._requested = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="reloader", daemon=True)
+        self._thread.start()
+
+    def request(self):
+        self._requested.set()
+
+    def _run(self):
+        mtimes = _mtimes(self.paths)
+        while True:
+            requested = self._requested.wait(self.interval or None)
+            if self._stopping:
+                return
+            self._requested.clear()
+            latest = _mtimes(self.paths)
+            if not requested and latest == mtimes:
+                continue
+            mtimes = latest
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Reloading failed, keeping what was loaded")
+
+    def stop(self):
+        self._stopping = True
+        self._requested.set()
+        self._thread.join()
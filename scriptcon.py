@@ -1,8 +1,1697 @@
 import unicodedata
+import pickle
 import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+
+try:
+    from re import _parser as _sre_parse
+except ImportError:
+    import sre_parse as _sre_parse
+
+# Characters whose lowercase form depends on context or spans several
+# codepoints, so that lowering a window is not the same as lowering each of
+# its characters.
+_CONTEXT_LOWER = ("σ", "ς", "̇")
+
+# The schemes convert() compiled for the dictionaries it was last called
+# with, by id(), least recently used first. Each is kept with its dictionary,
+# so that the id is not reused while it is cached
+_compiled = OrderedDict()
+_compiled_lock = threading.Lock()
+_COMPILED_LIMIT = 16
+
+# Called with what each stage does when set, see set_recorder()
+_recorder = None
+
+# ASCII characters that normalisation never combines with what follows them,
+# found by _inert_ascii()
+_inert = None
+
+# Characters by the single character they lowercase to, other than
+# themselves, found by _uppercase()
+_uppercase_of = None
+
+# Characters with a canonical decomposition, other than Hangul syllables, by
+# the characters they decompose to, found by _decompositions()
+_decomposition_of = None
+
+# Combining marks that case insensitive patterns may match through another
+# character, found by _cased_marks()
+_cased_mark_chars = None
+
+# Characters other than combining marks that may break each normal form when
+# they start or end a replacement, found by _unjoinable()
+_unjoinable_chars = None
+
+# Number of times a repeating regex stage may substitute its pattern before
+# NoFixpoint is raised, unless its subdict sets "max_iterations"
+MAX_ITERATIONS = 100
+
+# Most strings a regex may match for it to be fused with others, see
+# _regex_language()
+_FUSE_LIMIT = 256
+
+# Longest text that a fused regex stage substitutes in a single scan. sre
+# scans for an alternation of groups slower than for each of them on its
+# own, which only pays off while the calls saved cost more than the scans.
+_FUSED_TEXT_LIMIT = 128
+
+# Inline flags that apply to a whole pattern, which a fused pattern takes as
+# flags instead
+_LEADING_FLAGS = re.compile(r"^(?:\(\?[aiLmsux]+\))+")
+
+# Version of the format written by dump(), to be raised whenever the compiled
+# form of schemes changes
+ARTIFACT_VERSION = 7
+# Version of invert(), to be raised whenever what it returns for the same
+# dictionary changes, so that dictgen.py inverts its schemes again
+INVERT_VERSION = 1
+_ARTIFACT_MAGIC = b"scriptcon"
+
+
+def _code_points(end):
+    """Returns a string of every code point below end, a multiple of 0x10000,
+    put together a byte column at a time rather than with a chr() call for
+    each code point."""
+    codes = bytearray(4 * end)
+    codes[0::4] = bytes(range(256)) * (end >> 8)
+    codes[1::4] = b"".join(bytes((high,)) * 256 for high in range(256)) * (end >> 16)
+    codes[2::4] = b"".join(bytes((plane,)) * 0x10000 for plane in range(end >> 16))
+    return codes.decode("utf-32-le", "surrogatepass")
+
+
+def _changed_chars(end, *changes):
+    """Yields the characters below end, a multiple of 0x10000, of the blocks
+    of 256 code points that any of changes, such as str.lower, changes as a
+    whole. Each of the other blocks is passed over with a single call."""
+    chars = _code_points(end)
+    for start in range(0, end, 256):
+        block = chars[start : start + 256]
+        if any(change(block) != block for change in changes):
+            yield from block
+
+
+def _uppercase(char):
+    """Returns the characters other than char that lowercase to it."""
+    global _uppercase_of
+    if _uppercase_of is None:
+        uppercase_of = {}
+        # No cased character comes after the Supplementary Multilingual Plane
+        for upper in _changed_chars(0x20000, str.lower):
+            lowered = upper.lower()
+            if len(lowered) == 1 and lowered != upper:
+                uppercase_of.setdefault(lowered, []).append(upper)
+        # Set once complete, for other threads compiling meanwhile
+        _uppercase_of = uppercase_of
+    return _uppercase_of.get(char, [])
+
+
+def _build_matcher(table, sub_lengths, to_reverse, caps_insensitive):
+    """Builds a trie matcher for a dict subdict, or returns (None, None) if
+    the subdict's rules cannot be found in a single pass with the same
+    result as the per-length window walk.
+
+    Returns the matcher and a translation. The matcher is a (trie, rescan,
+    depth) tuple. Reverse subdicts get a trie of reversed keys. rescan is
+    the key length when replacements have to be scanned again for further
+    matches, and 0 otherwise. depth is the length of the longest key.
+
+    The translation is a str.translate() table for the single character
+    keys that never take part in another match, or None if there are none.
+    Those keys are left out of the trie, which may then be empty, and the
+    translation is applied to its output."""
+    if list(sub_lengths) != sorted(set(sub_lengths), reverse=True):
+        return None, None
+
+    rules = {}
+    for key, value in table.items():
+        if len(key) not in sub_lengths or not key:
+            continue
+        if caps_insensitive:
+            if key != key.lower():
+                # A lowered window can never equal this key
+                continue
+            if any(char in key for char in _CONTEXT_LOWER):
+                return None, None
+        if not value:
+            return None, None
+        if to_reverse:
+            key = key[::-1]
+        rules[key] = value
+
+    # Replacements as the scan sees them, for the checks below
+    scanned_values = set()
+    for value in rules.values():
+        if to_reverse:
+            value = value[::-1]
+        if caps_insensitive:
+            value = value.lower()
+        scanned_values.add(value)
+
+    lengths = set(len(key) for key in rules)
+    key_chars = set("".join(rules))
+    rescan = 0
+    if len(lengths) > 1:
+        # Shorter passes would see the output of longer ones
+        for value in scanned_values:
+            if not key_chars.isdisjoint(value):
+                return None, None
+        # A longer key starting inside a shorter one would win the
+        # longer pass before the shorter key is ever looked at
+        longest_with_prefix = {}
+        for key in rules:
+            for end in range(1, len(key) + 1):
+                prefix = key[:end]
+                longest_with_prefix[prefix] = max(
+                    longest_with_prefix.get(prefix, 0), len(key)
+                )
+        for key in rules:
+            for start in range(1, len(key)):
+                if longest_with_prefix.get(key[start:], 0) > len(key):
+                    return None, None
+    elif lengths:
+        # With one length the output is rescanned, so a replacement must
+        # never complete a window that was already passed
+        (length,) = lengths
+        for value in scanned_values:
+            if not key_chars.isdisjoint(value):
+                rescan = length
+            for key in rules:
+                for offset in range(length):
+                    overlap = min(len(value), length - offset)
+                    if key[offset : offset + overlap] == value[:overlap]:
+                        return None, None
+
+    # A single character key can be translated after the trie has run when
+    # no longer key contains it, its replacement holds nothing the scan
+    # would look at again and nothing left in the trie replaces to it
+    long_key_chars = set("".join(key for key in rules if len(key) > 1))
+    translated = {
+        key
+        for key, value in rules.items()
+        if len(key) == 1
+        and key not in long_key_chars
+        and key_chars.isdisjoint(value.lower() if caps_insensitive else value)
+    }
+    for key, value in rules.items():
+        if key not in translated:
+            translated.difference_update(value.lower() if caps_insensitive else value)
+    translation = None
+    if translated:
+        translation = {}
+        for key in translated:
+            value = rules.pop(key)
+            translation[ord(key)] = value
+            if caps_insensitive:
+                for char in _uppercase(key):
+                    translation[ord(char)] = value
+        lengths = set(len(key) for key in rules)
+        if rescan:
+            # Only the trie's own replacements need scanning again now
+            key_chars = set("".join(rules))
+            rescan = 0
+            for value in rules.values():
+                if not key_chars.isdisjoint(
+                    value.lower() if caps_insensitive else value
+                ):
+                    rescan = max(lengths)
+
+    trie = {}
+    for key, value in rules.items():
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[None] = value
+    return (trie, rescan, max(lengths, default=0)), translation
+
+
+def _trie_chars(trie, chars):
+    """Adds the characters of every key in a trie to chars and returns it."""
+    for char, node in trie.items():
+        if char is not None:
+            chars.add(char)
+            _trie_chars(node, chars)
+    return chars
+
+
+def _match_forward(text, index, trie, caps_insensitive):
+    """Returns the end and replacement of the longest key starting at index,
+    or None."""
+    node = trie
+    found = None
+    while index < len(text):
+        char = text[index]
+        if caps_insensitive:
+            char = char.lower()
+        node = node.get(char)
+        if node is None:
+            break
+        index += 1
+        if None in node:
+            found = index, node[None]
+    return found
+
+
+def _match_reverse(text, index, trie, caps_insensitive):
+    """Returns the start and replacement of the longest key ending at index,
+    or None."""
+    node = trie
+    found = None
+    while index > 0:
+        index -= 1
+        char = text[index]
+        if caps_insensitive:
+            char = char.lower()
+        node = node.get(char)
+        if node is None:
+            break
+        if None in node:
+            found = index, node[None]
+    return found
+
+
+def _replace_forward(
+    text,
+    trie,
+    caps_insensitive,
+    rescan,
+    start=0,
+    head="",
+    checkpoints=None,
+    counts=None,
+):
+    """Replaces every key in text, continuing from start with head as the
+    output so far. If checkpoints is a pair of lists, every index the scan
+    passes with no replacement pending is added to the first and the
+    length of the output up to it to the second. If counts is a list, the
+    number of replacements is added to its first item."""
+    replacements = 0
+    output = [head]
+    append = output.append
+    size = len(head)
+    copied = index = start
+    # Unscanned tail of the last replacement, which comes before text[index:]
+    pending = ""
+    while index < len(text) or pending:
+        if pending:
+            window = pending + text[index : index + rescan]
+            found = _match_forward(window, 0, trie, caps_insensitive)
+            if found is None:
+                append(pending[0])
+                size += 1
+                pending = pending[1:]
+                continue
+            end, replace_to = found
+            replacements += 1
+            if end > len(pending):
+                index += end - len(pending)
+                pending = ""
+            else:
+                pending = pending[end:]
+            append(replace_to[0])
+            size += 1
+            pending = replace_to[1:] + pending
+            copied = index
+            continue
+
+        if checkpoints is not None:
+            checkpoints[0].append(index)
+            checkpoints[1].append(size + index - copied)
+        found = _match_forward(text, index, trie, caps_insensitive)
+        if found is None:
+            index += 1
+            continue
+        end, replace_to = found
+        replacements += 1
+        append(text[copied:index])
+        size += index - copied
+        if rescan:
+            append(replace_to[0])
+            size += 1
+            pending = replace_to[1:]
+        else:
+            append(replace_to)
+            size += len(replace_to)
+        copied = index = end
+    append(text[copied:])
+    if counts is not None:
+        counts[0] += replacements
+    return "".join(output)
+
+
+def _replace_reverse(
+    text, trie, caps_insensitive, rescan, checkpoints=None, stop=None, counts=None
+):
+    """Mirror image of _replace_forward, with the output built back to front.
+
+    If checkpoints is a pair of lists, every index the scan reaches with no
+    replacement pending is added to the first, in descending order, and the
+    length of the output after it to the second. Everything left of such an
+    index converts the same whatever follows it, so stop may be a function
+    returning that conversion for an index when it is already known, which
+    ends the scan there. counts is as for _replace_forward."""
+    replacements = 0
+    output = []
+    append = output.append
+    size = 0
+    copied = index = len(text)
+    # Unscanned head of the last replacement, which comes after text[:index]
+    pending = ""
+    while index > 0 or pending:
+        if pending:
+            start = max(0, index - rescan)
+            window = text[start:index] + pending
+            found = _match_reverse(window, len(window), trie, caps_insensitive)
+            if found is None:
+                append(pending[-1])
+                size += 1
+                pending = pending[:-1]
+                continue
+            begin, replace_to = found
+            replacements += 1
+            if begin < index - start:
+                index = start + begin
+                pending = ""
+            else:
+                pending = pending[: begin - (index - start)]
+            append(replace_to[-1])
+            size += 1
+            pending = pending + replace_to[:-1]
+            copied = index
+            continue
+
+        if checkpoints is not None:
+            if stop is not None:
+                head = stop(index)
+                if head is not None:
+                    append(text[index:copied])
+                    output.reverse()
+                    if counts is not None:
+                        counts[0] += replacements
+                    return head + "".join(output)
+            checkpoints[0].append(index)
+            checkpoints[1].append(size + copied - index)
+        found = _match_reverse(text, index, trie, caps_insensitive)
+        if found is None:
+            index -= 1
+            continue
+        begin, replace_to = found
+        replacements += 1
+        append(text[index:copied])
+        size += copied - index
+        if rescan:
+            append(replace_to[-1])
+            size += 1
+            pending = replace_to[:-1]
+        else:
+            append(replace_to)
+            size += len(replace_to)
+        copied = index = begin
+    append(text[:copied])
+    output.reverse()
+    if counts is not None:
+        counts[0] += replacements
+    return "".join(output)
+
+
+def _common_prefix(a, b):
+    """Returns the length of the longest common prefix of a and b."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.startswith(b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class Checkpoint(namedtuple("Checkpoint", ("text", "output", "indices", "lengths"))):
+    """Where a dict stage can pick up converting a text that starts like the
+    one it last converted, made by DictStage.resume().
+
+    indices are the ascending positions in text that the scan reached with
+    nothing pending, and lengths the length of output before each of them."""
+
+    __slots__ = ()
+
+
+def _replace_windows(
+    text, table, sub_lengths, to_reverse, caps_insensitive, counts=None
+):
+    replacements = 0
+    for sub_length in sub_lengths:
+        index = 0
+        while index <= len(text) - sub_length:
+
+            if to_reverse:
+                sub_string = text[len(text) - index - sub_length : len(text) - index]
+            else:
+                sub_string = text[index : index + sub_length]
+            key = sub_string
+
+            if caps_insensitive:
+                key = key.lower()
+
+            if key in table:
+                replacements += 1
+                input_text = text
+                replace_from = sub_string
+
+                replace_to = table[key]
+
+                if to_reverse:
+                    input_text = input_text[::-1]
+                    replace_from = replace_from[::-1]
+                    replace_to = replace_to[::-1]
+
+                text = input_text.replace(replace_from, replace_to, 1)
+
+                if to_reverse:
+                    text = text[::-1]
+            index += 1
+    if counts is not None:
+        counts[0] += replacements
+    return text
+
+
+class NoFixpoint(RuntimeError):
+    """Raised when a repeating regex stage keeps matching after its limit of
+    substitutions, or comes back to a text it already made."""
+
+
+def _substitute(pattern, repl, text, count, repeat, limit, counts=None):
+    """Substitutes pattern with repl in text, over and over while it matches
+    if repeat is set, and returns the result. counts is as for
+    RegexStage.apply()."""
+    # The texts made so far, which come back in a cycle. Hashes alone could
+    # collide and report a cycle that isn't there
+    seen = set()
+    for _ in range(limit):
+        text, made = pattern.subn(repl, text, count)
+        if counts is not None:
+            counts[0] += made
+            counts[1] += 1
+        if not repeat or not made:
+            return text
+        if text in seen:
+            raise NoFixpoint(
+                "Pattern " + repr(pattern.pattern) + " substitutes in a cycle"
+            )
+        seen.add(text)
+    raise NoFixpoint(
+        "Pattern "
+        + repr(pattern.pattern)
+        + " still matches after "
+        + str(limit)
+        + " substitutions"
+    )
+
+
+class DictStage(
+    namedtuple(
+        "DictStage",
+        (
+            "table",
+            "sub_lengths",
+            "matcher",
+            "translation",
+            "reverse",
+            "caps_insensitive",
+            "decomposed",
+            "keeps_form",
+        ),
+    )
+):
+    """A compiled "dict" subdict. keeps_form is set when replacing keys in
+    text that is in the stage's normal form always leaves it in that form.
+    table is None once compact() has left it out for the matcher."""
+
+    __slots__ = ()
+
+    @property
+    def form(self):
+        return "NFD" if self.decomposed else "NFC"
+
+    def apply(self, text, form=None, counts=None):
+        """Converts text, which is known to be in the normal form form unless
+        that is None. If counts is a list, the number of replacements made is
+        added to its first item."""
+        text = _normalize(self.form, text, form)
+
+        if self.matcher is None:
+            return _replace_windows(
+                text,
+                self.table,
+                self.sub_lengths,
+                self.reverse,
+                self.caps_insensitive,
+                counts,
+            )
+        trie, rescan, _ = self.matcher
+        if trie and self.reverse:
+            text = _replace_reverse(
+                text, trie, self.caps_insensitive, rescan, counts=counts
+            )
+        elif trie:
+            text = _replace_forward(
+                text, trie, self.caps_insensitive, rescan, counts=counts
+            )
+        return self._translate(text, counts)
+
+    def _translate(self, text, counts=None):
+        """Replaces the keys left out of the trie, see _build_matcher()."""
+        if self.translation is None:
+            return text
+        if counts is not None:
+            counts[0] += sum(ord(char) in self.translation for char in text)
+        return text.translate(self.translation)
+
+    def looks_at(self, chars):
+        """Returns those of chars that the stage may replace or match as part
+        of a key, or None if it may replace text depending on characters
+        that are not next to each other."""
+        if self.matcher is None:
+            # str.replace() replaces the first occurrence of a key anywhere
+            return None
+        if self.table is not None:
+            key_chars = set("".join(self.table))
+        else:
+            key_chars = _trie_chars(self.matcher[0], set())
+            key_chars.update(map(chr, self.translation or ()))
+        return {
+            char
+            for char in chars
+            if char in key_chars
+            or (self.caps_insensitive and char.lower() in key_chars)
+        }
+
+    def resume(self, text, checkpoint, form=None, counts=None):
+        """Like apply(), but reuses as much as possible of the conversion
+        that made checkpoint, which may be None. Returns the result and a
+        checkpoint for the next call."""
+        if self.matcher is None or not self.matcher[0]:
+            # Translating alone is not worth picking up from a checkpoint
+            return self.apply(text, form, counts), None
+        if self.translation is not None:
+            # Checkpoints hold the output of the trie, which is translated
+            # afterwards
+            output, checkpoint = self._resume(text, checkpoint, form, counts)
+            return self._translate(output, counts), checkpoint
+        return self._resume(text, checkpoint, form, counts)
+
+    def _resume(self, text, checkpoint, form=None, counts=None):
+        text = _normalize(self.form, text, form)
+        if checkpoint is not None and checkpoint.text == text:
+            return checkpoint.output, checkpoint
+
+        trie, rescan, depth = self.matcher
+        indices, lengths = [], []
+        if self.reverse:
+            stopped = []
+            limit = (
+                _common_prefix(text, checkpoint.text) if checkpoint is not None else 0
+            )
+
+            def resume_at(index):
+                if index > limit:
+                    return None
+                position = bisect_left(checkpoint.indices, index)
+                if checkpoint.indices[position : position + 1] != [index]:
+                    return None
+                stopped.append(position)
+                return checkpoint.output[: checkpoint.lengths[position]]
+
+            output = _replace_reverse(
+                text,
+                trie,
+                self.caps_insensitive,
+                rescan,
+                (indices, lengths),
+                resume_at if checkpoint is not None else None,
+                counts,
+            )
+            # Lengths after each index become lengths before it, and the
+            # indices left of where the scan stopped carry over
+            indices.reverse()
+            lengths = [len(output) - length for length in reversed(lengths)]
+            if stopped:
+                kept = stopped[0] + 1
+                indices = checkpoint.indices[:kept] + indices
+                lengths = checkpoint.lengths[:kept] + lengths
+            return output, Checkpoint(text, output, indices, lengths)
+
+        start, head = 0, ""
+        if checkpoint is not None:
+            # A decision before an index looked at most depth characters
+            # past it
+            limit = _common_prefix(text, checkpoint.text) - depth
+            kept = bisect_left(checkpoint.indices, limit + 1)
+            if kept:
+                start = checkpoint.indices[kept - 1]
+                head = checkpoint.output[: checkpoint.lengths[kept - 1]]
+                indices = checkpoint.indices[: kept - 1]
+                lengths = checkpoint.lengths[: kept - 1]
+        output = _replace_forward(
+            text,
+            trie,
+            self.caps_insensitive,
+            rescan,
+            start,
+            head,
+            (indices, lengths),
+            counts,
+        )
+        return output, Checkpoint(text, output, indices, lengths)
+
+
+class RegexStage(
+    namedtuple(
+        "RegexStage",
+        ("pattern", "repl", "count", "repeat", "decomposed", "keeps_form", "limit"),
+    )
+):
+    """A compiled "regex" subdict, with keeps_form as for DictStage. limit is
+    the number of substitutions a repeating stage may make."""
+
+    __slots__ = ()
+
+    @property
+    def form(self):
+        return "NFD" if self.decomposed else "NFC"
+
+    def apply(self, text, form=None, counts=None):
+        """Converts text, which is known to be in the normal form form unless
+        that is None. If counts is a list, the number of replacements made is
+        added to its first item and the number of times the pattern was
+        substituted to its second."""
+        text = _normalize(self.form, text, form)
+        return _substitute(
+            self.pattern,
+            self.repl,
+            text,
+            self.count,
+            self.repeat,
+            self.limit,
+            counts,
+        )
+
+    def resume(self, text, checkpoint, form=None, counts=None):
+        return self.apply(text, form, counts), None
+
+    def looks_at(self, chars):
+        """Returns those of chars that the pattern may match, or None if it
+        may match anything, look around its match or match nothing."""
+        if self.count:
+            return None
+        parsed = _sre_parse.parse(self.pattern.pattern, self.pattern.flags)
+        ranges = []
+        if parsed.getwidth()[0] == 0 or not _pattern_ranges(parsed, ranges):
+            return None
+        if not ranges:
+            return set()
+        # Ignoring case in any case, which only ever finds more characters
+        matches = re.compile(
+            "["
+            + "".join(
+                re.escape(chr(low)) + "-" + re.escape(chr(high)) for low, high in ranges
+            )
+            + "]",
+            re.IGNORECASE,
+        )
+        return {char for char in chars if matches.fullmatch(char)}
+
+
+class RegexSetStage(
+    namedtuple(
+        "RegexSetStage",
+        (
+            "pattern",
+            "templates",
+            "stages",
+            "repeat",
+            "decomposed",
+            "keeps_form",
+            "limit",
+        ),
+    )
+):
+    """Adjacent regex stages fused by _fuse_regex_stages() into a single
+    pattern, an alternation of theirs in capturing groups. templates maps
+    the number of each of those groups to the replacement template of its
+    stage, split by _template_pieces() with its groups renumbered."""
+
+    __slots__ = ()
+
+    @property
+    def form(self):
+        return "NFD" if self.decomposed else "NFC"
+
+    def _expand(self, match):
+        return "".join(
+            piece if isinstance(piece, str) else match.group(piece) or ""
+            for piece in self.templates[match.lastindex]
+        )
+
+    def apply(self, text, form=None, counts=None):
+        """Like RegexStage.apply()."""
+        text = _normalize(self.form, text, form)
+        if len(text) > _FUSED_TEXT_LIMIT:
+            form = self.form
+            for stage in self.stages:
+                text = stage.apply(text, form, counts)
+                form = stage.form if stage.keeps_form else None
+            return text
+        return _substitute(
+            self.pattern, self._expand, text, 0, self.repeat, self.limit, counts
+        )
+
+    def resume(self, text, checkpoint, form=None, counts=None):
+        return self.apply(text, form, counts), None
+
+    def looks_at(self, chars):
+        looked_at = set()
+        for stage in self.stages:
+            stage_looks_at = stage.looks_at(chars)
+            if stage_looks_at is None:
+                return None
+            looked_at |= stage_looks_at
+        return looked_at
+
+
+def _strings(items, limit):
+    """Returns every string that the items of a parsed pattern may match, or
+    None if they may match more than limit strings or use anything other
+    than literals, character sets, groups, alternation and bounded
+    repetition."""
+    strings = [""]
+    for op, av in items:
+        op = str(op)
+        if op == "LITERAL":
+            options = [chr(av)]
+        elif op == "IN":
+            ranges = []
+            if not _pattern_ranges(((op, av),), ranges):
+                return None
+            if sum(high - low + 1 for low, high in ranges) > limit:
+                return None
+            options = [
+                chr(code) for low, high in ranges for code in range(low, high + 1)
+            ]
+        elif op == "SUBPATTERN":
+            options = _strings(av[-1], limit)
+        elif op == "BRANCH":
+            options = []
+            for branch in av[1]:
+                branch_strings = _strings(branch, limit)
+                if branch_strings is None:
+                    return None
+                options += branch_strings
+        elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            low, high, subpattern = av
+            once = _strings(subpattern, limit)
+            if once is None or high == _sre_parse.MAXREPEAT or high > limit:
+                return None
+            options = []
+            repeated = [""]
+            for times in range(high + 1):
+                if times >= low:
+                    options += repeated
+                if len(options) > limit:
+                    return None
+                repeated = [a + b for a in repeated for b in once]
+        else:
+            return None
+        if options is None or len(strings) * len(options) > limit:
+            return None
+        strings = [a + b for a in strings for b in options]
+    return strings
+
+
+def _fold(text, ignore_case):
+    """Returns text with every character replaced by one that stands for all
+    of those it matches, or None if that is not known."""
+    if not ignore_case:
+        return text
+    folded = ""
+    for char in text:
+        char = char.upper().lower()
+        if len(char) != 1:
+            return None
+        folded += char
+    return folded
+
+
+def _overlaps(a, b):
+    """Returns whether a and b can occur overlapping each other in a text."""
+    return any(
+        a[start : start + len(b)] == b[: len(a) - start] for start in range(len(a))
+    ) or any(
+        b[start : start + len(a)] == a[: len(b) - start] for start in range(len(b))
+    )
+
+
+def _regex_language(stage):
+    """Returns the strings that a regex stage may match and those it may
+    replace them with, folded by _fold(), or None if they are not known or
+    any of them is empty."""
+    if stage.count or _template_pieces(stage.repl, stage.pattern) is None:
+        return None
+    parsed = _sre_parse.parse(stage.pattern.pattern, stage.pattern.flags)
+    strings = _strings(parsed, _FUSE_LIMIT)
+    if not strings:
+        return None
+    ignore_case = bool(stage.pattern.flags & re.IGNORECASE)
+    matched, replaced = set(), set()
+    for string in strings:
+        match = stage.pattern.fullmatch(string)
+        if match is None:
+            return None
+        output = match.expand(stage.repl)
+        folded = (_fold(string, ignore_case), _fold(output, ignore_case))
+        if not all(folded):
+            return None
+        matched.add(folded[0])
+        replaced.add(folded[1])
+    return matched, replaced
+
+
+def _independent(language, other):
+    """Returns whether two regex stages with the given _regex_language()s,
+    the first of them substituted before the other, never match overlapping
+    text and never make matches for each other, so that substituting both at
+    once does the same."""
+    matched, replaced = language
+    other_matched, other_replaced = other
+    if any(_overlaps(a, b) for a in matched | replaced for b in other_matched):
+        return False
+    return not any(_overlaps(a, b) for a in other_replaced for b in matched)
+
+
+def _fuse_regex_stages(stages):
+    """Returns stages with every run of adjacent regex stages that can be
+    substituted at once, as _independent() tells, fused into a
+    RegexSetStage. A run only goes on after stages that keep the normal
+    form, as what another makes could compose with the text around it,
+    which _independent() does not see."""
+    fused = []
+    run = []
+
+    def end_run():
+        if len(run) > 1:
+            patterns = []
+            templates = {}
+            group = 1
+            for stage, _ in run:
+                patterns.append(
+                    "(" + _LEADING_FLAGS.sub("", stage.pattern.pattern) + ")"
+                )
+                templates[group] = tuple(
+                    piece if isinstance(piece, str) else group + piece
+                    for piece in _template_pieces(stage.repl, stage.pattern)
+                )
+                group += stage.pattern.groups + 1
+            first = run[0][0]
+            fused.append(
+                RegexSetStage(
+                    pattern=re.compile("|".join(patterns), first.pattern.flags),
+                    templates=templates,
+                    stages=tuple(stage for stage, _ in run),
+                    repeat=first.repeat,
+                    decomposed=first.decomposed,
+                    keeps_form=all(stage.keeps_form for stage, _ in run),
+                    limit=first.limit,
+                )
+            )
+        else:
+            fused.extend(stage for stage, _ in run)
+        run.clear()
+
+    for stage in stages:
+        language = None
+        if isinstance(stage, RegexStage) and not stage.pattern.groupindex:
+            language = _regex_language(stage)
+        if (
+            language is not None
+            and run
+            and (
+                stage.pattern.flags,
+                stage.repeat,
+                stage.decomposed,
+                stage.limit,
+            )
+            == (
+                run[0][0].pattern.flags,
+                run[0][0].repeat,
+                run[0][0].decomposed,
+                run[0][0].limit,
+            )
+            and all(other_stage.keeps_form for other_stage, _ in run)
+            and all(_independent(other, language) for _, other in run)
+        ):
+            run.append((stage, language))
+            continue
+        end_run()
+        if language is None:
+            fused.append(stage)
+        else:
+            run.append((stage, language))
+    end_run()
+    return tuple(fused)
+
+
+def _pattern_ranges(items, ranges):
+    """Adds the ranges of characters that the items of a parsed pattern may
+    match to ranges as (low, high) code point pairs. Returns False if they
+    may match any character or look around what they match."""
+    for op, av in items:
+        op = str(op)
+        if op == "LITERAL":
+            ranges.append((av, av))
+        elif op == "IN":
+            for item_op, item_av in av:
+                item_op = str(item_op)
+                if item_op == "LITERAL":
+                    ranges.append((item_av, item_av))
+                elif item_op == "RANGE":
+                    ranges.append(item_av)
+                else:
+                    return False
+        elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            if not _pattern_ranges(av[2], ranges):
+                return False
+        elif op == "SUBPATTERN":
+            if not _pattern_ranges(av[-1], ranges):
+                return False
+        elif op == "ATOMIC_GROUP":
+            if not _pattern_ranges(av, ranges):
+                return False
+        elif op == "BRANCH":
+            for branch in av[1]:
+                if not _pattern_ranges(branch, ranges):
+                    return False
+        elif op != "GROUPREF":
+            return False
+    return True
+
+
+def _decompositions():
+    """Returns the characters with a canonical decomposition, other than
+    Hangul syllables, by the characters they decompose to."""
+    global _decomposition_of
+    if _decomposition_of is None:
+        decomposition_of = {}
+        # A block with any of them changes when it is decomposed. Those of
+        # Hangul syllables have nothing else and are skipped
+        for char in _changed_chars(
+            0x30000,
+            lambda block: (
+                block
+                if "\uac00" <= block[0] <= "\ud7a3"
+                else unicodedata.normalize("NFD", block)
+            ),
+        ):
+            decomposition = unicodedata.decomposition(char)
+            if decomposition and not decomposition.startswith("<"):
+                decomposition_of[char] = tuple(
+                    chr(int(part, 16)) for part in decomposition.split()
+                )
+        # Set once complete, for other threads compiling meanwhile
+        _decomposition_of = decomposition_of
+    return _decomposition_of
+
+
+def _cased_marks():
+    """Returns the combining marks that have a case, which a case
+    insensitive character class may match without containing them."""
+    global _cased_mark_chars
+    if _cased_mark_chars is None:
+        _cased_mark_chars = "".join(
+            char
+            for char in _changed_chars(0x20000, str.lower, str.upper)
+            if unicodedata.combining(char)
+            and (char.lower() != char or char.upper() != char)
+        )
+    return _cased_mark_chars
+
+
+def _inert_ascii():
+    """Returns the ASCII characters that no precomposed character starts
+    with, so that normalisation never combines them with what follows."""
+    global _inert
+    if _inert is None:
+        composing = set(
+            parts[0] for char, parts in _decompositions().items() if char >= "\x80"
+        )
+        _inert = frozenset(chr(code) for code in range(0x80)) - composing
+    return _inert
+
+
+def _normalize(form, text, known=None):
+    """Returns text in the normal form form, given that it is already in the
+    normal form known unless that is None."""
+    if known == form or text.isascii():
+        return text
+    return unicodedata.normalize(form, text)
+
+
+def _unjoinable(form):
+    """Returns the characters that may leave text out of the normal form
+    form, NFC or NFD, when they are put right after other text, and those
+    that may when other text is put right after them, other than combining
+    marks, which always may. See _joins()."""
+    global _unjoinable_chars
+    if _unjoinable_chars is None:
+        decomposable, changed = set(), set()
+        firsts, seconds = set(), set()
+        for char, parts in _decompositions().items():
+            decomposable.add(char)
+            if unicodedata.normalize("NFC", char) != char:
+                changed.add(char)
+            elif len(parts) == 2:
+                firsts.add(parts[0])
+                seconds.add(parts[1])
+        # Hangul syllables decompose and compose algorithmically, without
+        # entries in the character database
+        syllables = [chr(code) for code in range(0xAC00, 0xD7A4)]
+        decomposable.update(syllables)
+        firsts.update(syllables[::28])
+        firsts.update(chr(code) for code in range(0x1100, 0x1113))
+        seconds.update(chr(code) for code in range(0x1161, 0x1176))
+        seconds.update(chr(code) for code in range(0x11A8, 0x11C3))
+        _unjoinable_chars = {
+            "NFC": (frozenset(changed | seconds), frozenset(changed | firsts)),
+            "NFD": (frozenset(decomposable),) * 2,
+        }
+    return _unjoinable_chars[form]
+
+
+def _joins(char, chars):
+    """Returns whether char is a combining mark or one of chars, as returned
+    by _unjoinable()."""
+    return unicodedata.combining(char) != 0 or char in chars
+
+
+def _ranges_avoid(ranges, chars, flags):
+    """Returns whether a character class of ranges, as made by
+    _pattern_ranges(), matches no combining mark and none of chars with the
+    given flags."""
+    for low, high in ranges:
+        if any(unicodedata.combining(chr(code)) for code in range(low, high + 1)):
+            return False
+    matches = re.compile(
+        "["
+        + "".join(
+            re.escape(chr(low)) + "-" + re.escape(chr(high)) for low, high in ranges
+        )
+        + "]",
+        flags & re.IGNORECASE,
+    )
+    if flags & re.IGNORECASE and matches.search(_cased_marks()) is not None:
+        return False
+    return matches.search("".join(sorted(chars))) is None
+
+
+def _edge_ranges(items, ranges, last=False):
+    """Adds the ranges of characters that a match of the items of a parsed
+    pattern may start with, or end with if last is set, to ranges. Returns
+    False if they are not known or the match may be empty."""
+    for op, av in reversed(list(items)) if last else items:
+        op = str(op)
+        if op == "LITERAL":
+            ranges.append((av, av))
+            return True
+        elif op == "IN":
+            return _pattern_ranges(((op, av),), ranges)
+        elif op == "SUBPATTERN":
+            return _edge_ranges(av[-1], ranges, last)
+        elif op == "BRANCH":
+            return all(_edge_ranges(branch, ranges, last) for branch in av[1])
+        elif op in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            return av[0] > 0 and _edge_ranges(av[2], ranges, last)
+        else:
+            return False
+    return False
+
+
+def _template_pieces(repl, pattern):
+    """Splits a replacement template into its literal strings and the
+    numbers of the groups it refers to, or returns None if it has escapes
+    other than group references."""
+    pieces = []
+    for token in re.split(r"(\\g<\w+>|\\[1-9][0-9]?|\\.)", repl, flags=re.DOTALL):
+        if token.startswith("\\g<"):
+            name = token[3:-1]
+            pieces.append(int(name) if name.isdigit() else pattern.groupindex[name])
+        elif token.startswith("\\") and token[1:].isdigit():
+            pieces.append(int(token[1:]))
+        elif token.startswith("\\"):
+            return None
+        elif token:
+            pieces.append(token)
+    return pieces
+
+
+def _values_keep_form(values, form):
+    """Returns whether replacing anything in text in the normal form form
+    with any of values leaves it in that form."""
+    after, before = _unjoinable(form)
+    return all(
+        value
+        and unicodedata.normalize(form, value) == value
+        and not _joins(value[0], after)
+        and not _joins(value[-1], before)
+        for value in values
+    )
+
+
+def _regex_keeps_form(pattern, repl, form):
+    """Like _values_keep_form(), for the substitutions of a compiled pattern.
+
+    Groups must be at the top level of the pattern and never empty. The
+    replacement may end with the group that the pattern ends with, which
+    leaves what comes after the match next to the same characters."""
+    pieces = _template_pieces(repl, pattern)
+    if not pieces:
+        return False
+    parsed = _sre_parse.parse(pattern.pattern, pattern.flags)
+    groups = {}
+    for position, (op, av) in enumerate(parsed):
+        if str(op) == "SUBPATTERN" and av[0] is not None:
+            groups[av[0]] = position
+    after, before = _unjoinable(form)
+    for position, piece in enumerate(pieces):
+        is_last = position == len(pieces) - 1
+        if isinstance(piece, str):
+            if unicodedata.normalize(form, piece) != piece or _joins(piece[0], after):
+                return False
+            if is_last and _joins(piece[-1], before):
+                return False
+            continue
+        if piece not in groups:
+            return False
+        subpattern = parsed[groups[piece]][1][-1]
+        if subpattern.getwidth()[0] == 0:
+            return False
+        ranges = []
+        if not _edge_ranges(subpattern, ranges) or not _ranges_avoid(
+            ranges, after, pattern.flags
+        ):
+            return False
+        if is_last and groups[piece] != len(parsed) - 1:
+            ranges = []
+            if not _edge_ranges(subpattern, ranges, True) or not _ranges_avoid(
+                ranges, before, pattern.flags
+            ):
+                return False
+    return True
+
+
+def boundaries(stages) -> frozenset:
+    """Returns the characters that none of stages ever looks at. Text cut
+    right after any of them converts the same in pieces as it does whole."""
+    chars = set(_inert_ascii())
+    for stage in stages:
+        looked_at = stage.looks_at(chars)
+        if looked_at is None:
+            return frozenset()
+        chars -= looked_at
+    return frozenset(chars)
+
+
+def pieces(chunks, boundaries):
+    """Joins and cuts an iterable of text chunks into pieces that each end
+    with one of boundaries, except for the last. Only the text after the
+    last boundary seen so far is held back."""
+    last = (
+        re.compile("[" + "".join(re.escape(char) for char in boundaries) + "]")
+        if boundaries
+        else None
+    )
+    held = []
+    for chunk in chunks:
+        end = 0
+        if last is not None:
+            for match in last.finditer(chunk):
+                end = match.end()
+        if not end:
+            held.append(chunk)
+            continue
+        held.append(chunk[:end])
+        yield "".join(held)
+        held = [chunk[end:]]
+    rest = "".join(held)
+    if rest:
+        yield rest
+
+
+def set_recorder(recorder):
+    """Sets a function to be called after every stage of every conversion,
+    or None to stop. It is called with the name of the scheme, the index of
+    the stage in it, the seconds taken, the number of replacements, the
+    number of regex substitutions and the lengths of the stage's input and
+    output."""
+    global _recorder
+    _recorder = recorder
+
+
+def _record(names, index, method, text, *args):
+    """Calls method, a stage's apply() or resume(), with text and args and
+    hands what it did to the recorder for each of names."""
+    counts = [0, 0]
+    started = time.perf_counter()
+    result = method(text, *args, counts=counts)
+    seconds = time.perf_counter() - started
+    output = result if isinstance(result, str) else result[0]
+    recorder = _recorder
+    if recorder is not None:
+        for name in names:
+            recorder(name, index, seconds, *counts, len(text), len(output))
+    return result
+
+
+def _tree_ends(tree):
+    """Returns the indices of the schemes ending anywhere in a stage tree."""
+    ends, children = tree
+    return list(ends) + [
+        index for _, subtree in children for index in _tree_ends(subtree)
+    ]
+
+
+class Scheme(namedtuple("Scheme", ("stages", "name"), defaults=(None,))):
+    """A dictionary compiled by compile(), ready to convert text."""
+
+    __slots__ = ()
+
+    def convert(self, text, nfc=False):
+        """Converts text. nfc may be set when text is known to be in NFC
+        already, such as the result of another conversion."""
+        form = "NFC" if nfc else None
+        for index, stage in enumerate(self.stages):
+            if _recorder is None:
+                text = stage.apply(text, form)
+            else:
+                text = _record((self.name,), index, stage.apply, text, form)
+            form = stage.form if stage.keeps_form else None
+        return _normalize("NFC", text, form)
+
+    def resume(self, text, checkpoints=None, nfc=False):
+        """Like convert(), but reuses what it can of the conversion that
+        returned checkpoints, which pays off when text extends or edits the
+        end of that text. Returns the result and checkpoints for the next
+        call. The result is always the same as that of convert()."""
+        if checkpoints is None:
+            checkpoints = (None,) * len(self.stages)
+        resumed = []
+        form = "NFC" if nfc else None
+        for index, (stage, checkpoint) in enumerate(zip(self.stages, checkpoints)):
+            if _recorder is None:
+                text, checkpoint = stage.resume(text, checkpoint, form)
+            else:
+                text, checkpoint = _record(
+                    (self.name,), index, stage.resume, text, checkpoint, form
+                )
+            resumed.append(checkpoint)
+            form = stage.form if stage.keeps_form else None
+        return _normalize("NFC", text, form), tuple(resumed)
+
+    def stream(self, chunks):
+        """Converts text that comes as an iterable of chunks, yielding the
+        result in pieces as soon as it can. Memory use is bounded by the
+        longest run of text without any of boundaries(self.stages) in it,
+        such as a newline."""
+        for piece in pieces(chunks, boundaries(self.stages)):
+            yield self.convert(piece)
+
+
+def _stage_tree(branches):
+    """Arranges (index, stages) branches into a tree sharing equal leading
+    stages, as a pair of the indices ending here and the (stage, subtree)
+    children."""
+    ends = []
+    groups = []
+    for index, stages in branches:
+        if not stages:
+            ends.append(index)
+            continue
+        for stage, rest in groups:
+            if stage == stages[0]:
+                rest.append((index, stages[1:]))
+                break
+        else:
+            groups.append((stages[0], [(index, stages[1:])]))
+    return tuple(ends), tuple((stage, _stage_tree(rest)) for stage, rest in groups)
+
+
+class Fused(namedtuple("Fused", ("schemes", "tree"))):
+    """Several schemes converting the same text, made by fuse()."""
+
+    __slots__ = ()
+
+    def convert(self, text, nfc=False):
+        """Converts text with every scheme, returning a tuple with one result
+        per scheme."""
+        results = [None] * len(self.schemes)
+        text = _normalize("NFC", text, "NFC" if nfc else None)
+        pending = [(text, self.tree, "NFC", 0)]
+        while pending:
+            text, (ends, children), form, depth = pending.pop()
+            if ends:
+                text = _normalize("NFC", text, form)
+                form = "NFC"
+                for index in ends:
+                    results[index] = text
+            for stage, subtree in children:
+                if _recorder is None:
+                    output = stage.apply(text, form)
+                else:
+                    output = _record(
+                        self._names(subtree), depth, stage.apply, text, form
+                    )
+                output_form = stage.form if stage.keeps_form else None
+                pending.append((output, subtree, output_form, depth + 1))
+        return tuple(results)
+
+    def resume(self, text, checkpoints=None, nfc=False):
+        """Like convert(), picking up from checkpoints in the way of
+        Scheme.resume(). Returns the results and checkpoints for the next
+        call."""
+        results = [None] * len(self.schemes)
+        previous = iter(checkpoints or ())
+        resumed = []
+        text = _normalize("NFC", text, "NFC" if nfc else None)
+        pending = [(text, self.tree, "NFC", 0)]
+        while pending:
+            text, (ends, children), form, depth = pending.pop()
+            if ends:
+                text = _normalize("NFC", text, form)
+                form = "NFC"
+                for index in ends:
+                    results[index] = text
+            for stage, subtree in children:
+                if _recorder is None:
+                    output, checkpoint = stage.resume(text, next(previous, None), form)
+                else:
+                    output, checkpoint = _record(
+                        self._names(subtree),
+                        depth,
+                        stage.resume,
+                        text,
+                        next(previous, None),
+                        form,
+                    )
+                resumed.append(checkpoint)
+                output_form = stage.form if stage.keeps_form else None
+                pending.append((output, subtree, output_form, depth + 1))
+        return tuple(results), tuple(resumed)
+
+    def stages(self):
+        """Returns every stage of the fused schemes."""
+        found = []
+        pending = [self.tree]
+        while pending:
+            _, children = pending.pop()
+            for stage, subtree in children:
+                found.append(stage)
+                pending.append(subtree)
+        return found
+
+    def stream(self, chunks):
+        """Like Scheme.stream(), yielding tuples of pieces with one piece per
+        scheme."""
+        for piece in pieces(chunks, boundaries(self.stages())):
+            yield self.convert(piece)
+
+    def _names(self, tree):
+        """Names of the schemes that a stage leading to tree is part of."""
+        return [self.schemes[index].name for index in _tree_ends(tree)]
+
+
+def fuse(schemes):
+    """Combines schemes so that they normalise the text once and run the
+    stages they start with in common only once."""
+    schemes = tuple(schemes)
+    return Fused(
+        schemes,
+        _stage_tree([(index, scheme.stages) for index, scheme in enumerate(schemes)]),
+    )
+
+
+def _compile_stage(subdict):
+    """Compiles one subdict of a dictionary, or returns None for a subdict
+    that does nothing."""
+    if subdict.get("type", "dict") == "dict":
+        data, aliases, to_reverse, caps_insensitive = (
+            subdict.get("data", {}),
+            subdict.get("aliases", {}),
+            subdict.get("reverse", False),
+            subdict.get("caps_insensitive", False),
+        )
+        table = {**aliases, **data}
+        decomposed = bool(subdict.get("decomposed"))
+        sub_lengths = tuple(
+            subdict.get(
+                "sub_lengths",
+                sorted(set(len(point) for point in table), reverse=True),
+            )
+        )
+        matcher, translation = _build_matcher(
+            table, sub_lengths, to_reverse, caps_insensitive
+        )
+        return DictStage(
+            table=table,
+            sub_lengths=sub_lengths,
+            matcher=matcher,
+            translation=translation,
+            reverse=to_reverse,
+            caps_insensitive=caps_insensitive,
+            decomposed=decomposed,
+            keeps_form=_values_keep_form(
+                table.values(), "NFD" if decomposed else "NFC"
+            ),
+        )
+    elif subdict.get("type", "dict") == "regex":
+        params = subdict.get("params", None)
+        if params is None:
+            return None
+        pattern = re.compile(params["pattern"], params.get("flags", 0))
+        decomposed = bool(subdict.get("decomposed"))
+        return RegexStage(
+            pattern=pattern,
+            repl=params["repl"],
+            count=params.get("count", 0),
+            repeat=subdict.get("repeat", False),
+            decomposed=decomposed,
+            keeps_form=_regex_keeps_form(
+                pattern, params["repl"], "NFD" if decomposed else "NFC"
+            ),
+            limit=subdict.get("max_iterations", MAX_ITERATIONS),
+        )
+    else:
+        print('Unknown subdict type "' + str(subdict.get("type", "")) + '"')
+        return None
+
+
+def compile(dictionary, name=None):
+    """Compiles a dictionary from dict.json into a Scheme, with name as the
+    name it goes by in what is handed to the recorder. Adjacent regex
+    subdicts are fused where they can be."""
+    stages = (_compile_stage(subdict) for subdict in dictionary)
+    return Scheme(
+        _fuse_regex_stages(stage for stage in stages if stage is not None), name
+    )
+
+
+def invert(dictionary):
+    """Returns the inverse of a dictionary from dict.json, in the same format,
+    for converting its output back into its input.
+
+    The subdicts are undone in reverse order: dict subdicts by their data
+    turned around, which leaves out the aliases, and regex subdicts by their
+    undo pattern. Regex subdicts without one are left out."""
+    inverse = []
+    for subdict in reversed(dictionary):
+        decomposed = bool(subdict.get("decomposed"))
+        if subdict.get("type", "dict") == "dict":
+            form = "NFD" if decomposed else "NFC"
+            data = {}
+            for key, value in subdict.get("data", {}).items():
+                if value:
+                    data.setdefault(unicodedata.normalize(form, value), key)
+            inverse.append(
+                {
+                    "type": "dict",
+                    "sub_lengths": sorted(
+                        set(len(point) for point in data), reverse=True
+                    ),
+                    "reverse": False,
+                    "decomposed": decomposed,
+                    "caps_insensitive": False,
+                    "data": data,
+                    "aliases": {},
+                }
+            )
+        elif subdict.get("type", "dict") == "regex":
+            if subdict.get("undo") is None:
+                continue
+            inverse.append(
+                {
+                    "type": "regex",
+                    "decomposed": decomposed,
+                    "params": subdict["undo"],
+                    "undo": subdict.get("params"),
+                    "repeat": subdict.get("repeat", False),
+                }
+            )
+            if "max_iterations" in subdict:
+                inverse[-1]["max_iterations"] = subdict["max_iterations"]
+    return inverse
+
+
+def dump(schemes, digest) -> bytes:
+    """Serialises a mapping of compiled schemes into an artifact that load()
+    reads back without compiling them again. digest identifies the source of
+    the schemes, such as a hash of the dict.json they were compiled from."""
+    header = b"%s %d %s\n" % (_ARTIFACT_MAGIC, ARTIFACT_VERSION, digest.encode())
+    return header + pickle.dumps(dict(schemes), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load(data):
+    """Reads an artifact written by dump() and returns its digest and its
+    schemes. Raises ValueError if the artifact was written by another version
+    of this module."""
+    header, _, body = data.partition(b"\n")
+    fields = header.split(b" ")
+    if len(fields) != 3 or fields[0] != _ARTIFACT_MAGIC:
+        raise ValueError("Not a scriptcon artifact")
+    if fields[1] != str(ARTIFACT_VERSION).encode():
+        raise ValueError(
+            "Artifact version "
+            + fields[1].decode(errors="replace")
+            + " is not "
+            + str(ARTIFACT_VERSION)
+        )
+    return fields[2].decode(), pickle.loads(body)
+
+
+class _Compactor:
+    """Rebuilds stages with every string interned and every equal trie node
+    and translation stored once, across all the stages it rebuilds."""
+
+    def __init__(self):
+        self.shared = {}
+
+    def _share(self, key, value):
+        return self.shared.setdefault(key, value)
+
+    def trie(self, node):
+        compacted = {}
+        for char, child in node.items():
+            if char is None:
+                compacted[None] = sys.intern(child)
+            else:
+                compacted[sys.intern(char)] = self.trie(child)
+        # Children are shared already, so they are told apart by identity
+        key = ("trie",) + tuple(
+            sorted(
+                (char or "", id(child) if char is not None else child)
+                for char, child in compacted.items()
+            )
+        )
+        return self._share(key, compacted)
+
+    def translation(self, translation):
+        translation = {code: sys.intern(value) for code, value in translation.items()}
+        return self._share(
+            ("translation",) + tuple(sorted(translation.items())), translation
+        )
+
+    def stage(self, stage):
+        if isinstance(stage, RegexSetStage):
+            return stage._replace(stages=tuple(map(self.stage, stage.stages)))
+        if isinstance(stage, RegexStage):
+            return stage._replace(repl=sys.intern(stage.repl))
+        if stage.matcher is None:
+            return stage._replace(
+                table={
+                    sys.intern(key): sys.intern(value)
+                    for key, value in stage.table.items()
+                }
+            )
+        trie, rescan, depth = stage.matcher
+        return stage._replace(
+            # Only _replace_windows() and looks_at() need the table, and the
+            # latter gets by with the matcher
+            table=None,
+            matcher=(self.trie(trie), rescan, depth),
+            translation=stage.translation and self.translation(stage.translation),
+        )
+
+
+def compact(schemes) -> dict:
+    """Returns a mapping of compiled schemes converting the same as schemes,
+    but with the strings they hold interned and what they have in common,
+    such as equal branches of their tries, stored once."""
+    compactor = _Compactor()
+    return {
+        name: scheme._replace(stages=tuple(map(compactor.stage, scheme.stages)))
+        for name, scheme in schemes.items()
+    }
+
+
+def footprint(schemes) -> dict:
+    """Returns the approximate memory held by each of a mapping of compiled
+    schemes, in bytes, counting what they share in the first one that holds
+    it."""
+    seen = set()
+
+    def size(value):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        total = sys.getsizeof(value)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                total += size(key) + size(item)
+        elif isinstance(value, (tuple, list, set, frozenset)):
+            for item in value:
+                total += size(item)
+        return total
+
+    return {name: size(scheme) for name, scheme in schemes.items()}
 
 
 def convert(text, dictionary):
+    """Converts text with a dictionary from dict.json.
+
+    The compiled forms of the last few dictionaries are kept, so a
+    dictionary should not be modified after it has been used here, and one
+    used after many others is compiled again. Use compile() to hold on to a
+    Scheme directly."""
+    with _compiled_lock:
+        cached = _compiled.get(id(dictionary))
+        if cached is not None and cached[0] is dictionary:
+            _compiled.move_to_end(id(dictionary))
+    if cached is None or cached[0] is not dictionary:
+        # Compiled outside the lock, which would hold up other dictionaries
+        cached = (dictionary, compile(dictionary))
+        with _compiled_lock:
+            _compiled[id(dictionary)] = cached
+            if len(_compiled) > _COMPILED_LIMIT:
+                _compiled.popitem(last=False)
+    return cached[1].convert(text)
+
+
+def reference(text, dictionary):
+    """Converts text with a dictionary from dict.json the way this module
+    first did, walking windows of every length over the text without
+    compiling anything. It is slow, and may never return for a repeating
+    regex subdict that has no fixpoint, but it is what compiled schemes have
+    to agree with."""
     for subdict in dictionary:
         if subdict.get("type", "dict") == "dict":
             data, aliases, to_reverse, caps_insensitive = (
@@ -72,3 +1761,212 @@ def convert(text, dictionary):
         else:
             print('Unknown subdict type "' + str(subdict.get("type", "")) + '"')
     return unicodedata.normalize("NFC", text)
+
+
+# The schemes a main() worker converts with, set by _load_schemes()
+_cli_schemes = None
+
+
+def _load_schemes(path, names):
+    """Loads schemes by name from a dict.json, or a dict.pickle written by
+    dump(), for main(). Raises ValueError if any of them is not in it."""
+    global _cli_schemes
+    with open(path, "rb") as f:
+        data = f.read()
+    if path.endswith(".pickle"):
+        _, available = load(data)
+    else:
+        import json
+
+        available = json.loads(data)
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise ValueError(
+            path
+            + " has no scheme "
+            + ", ".join(missing)
+            + ", only "
+            + ", ".join(available)
+        )
+    if path.endswith(".pickle"):
+        _cli_schemes = [available[name] for name in names]
+    else:
+        _cli_schemes = [compile(available[name], name) for name in names]
+
+
+def _convert_batch(batch, separator):
+    """Converts every line or paragraph of a batch of UTF-8 encoded text on
+    its own, returning the encoded result for each of the schemes and the
+    number of lines or paragraphs."""
+    units = batch.decode("utf-8").split(separator)
+    return (
+        [
+            separator.join(scheme.convert(unit) for unit in units).encode("utf-8")
+            for scheme in _cli_schemes
+        ],
+        # A batch that ends with a separator splits into an empty unit last
+        len(units) - (units[-1] == ""),
+    )
+
+
+def _batches(data, separator, size):
+    """Yields slices of data, a bytes-like object, of about size bytes that
+    end right after a separator, except for the last one."""
+    start = 0
+    while start < len(data):
+        end = data.rfind(separator, start, start + size)
+        if end == -1:
+            end = data.find(separator, start + size)
+        end = len(data) if end == -1 else end + len(separator)
+        yield data[start:end]
+        start = end
+
+
+def _read_batches(file, separator, size):
+    """Like _batches(), for a file that cannot be mapped, such as stdin."""
+    rest = b""
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        data = rest + chunk
+        end = data.rfind(separator)
+        if end == -1:
+            rest = data
+            continue
+        end += len(separator)
+        yield data[:end]
+        rest = data[end:]
+    if rest:
+        yield rest
+
+
+def main(argv=None):
+    """Converts files or stdin from the command line."""
+    import argparse
+    import mmap
+    import os
+    import sys
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(
+        description="Converts text files with schemes from dict.json"
+    )
+    parser.add_argument(
+        "files", nargs="*", default=["-"], help="Files to convert, - for stdin"
+    )
+    parser.add_argument(
+        "-s",
+        "--scheme",
+        action="append",
+        required=True,
+        help="Scheme to convert to, may be given several times",
+    )
+    parser.add_argument(
+        "-d",
+        "--dict",
+        default="dict.json",
+        help="dict.json, or dict.pickle, to load the schemes from",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help="File to write to, - for stdout. With several schemes it must"
+        " contain {scheme}, which is replaced by the name of each",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of processes to convert in",
+    )
+    parser.add_argument(
+        "--paragraphs",
+        action="store_true",
+        default=False,
+        help="Converts every paragraph on its own rather than every line",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=1024 * 1024,
+        help="Bytes of input to hand to a process at a time",
+    )
+    args = parser.parse_args(argv)
+    if len(args.scheme) > 1 and "{scheme}" not in args.output:
+        parser.error("--output must contain {scheme} with several schemes")
+    separator = "\n\n" if args.paragraphs else "\n"
+    encoded_separator = separator.encode("utf-8")
+    # Loaded here even for --jobs, whose processes load them again, so that
+    # a bad --dict or --scheme is reported before any output is created
+    try:
+        _load_schemes(args.dict, args.scheme)
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError) as error:
+        parser.error(str(error))
+
+    outputs = []
+    for name in args.scheme:
+        path = args.output.replace("{scheme}", name)
+        outputs.append(sys.stdout.buffer if path == "-" else open(path, "wb"))
+
+    def batches():
+        for path in args.files:
+            if path == "-":
+                yield from _read_batches(
+                    sys.stdin.buffer, encoded_separator, args.batch_size
+                )
+                continue
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    yield from _batches(data, encoded_separator, args.batch_size)
+
+    started = time.perf_counter()
+    units = 0
+
+    def write(results):
+        nonlocal units
+        converted, count = results
+        for output, data in zip(outputs, converted):
+            output.write(data)
+        units += count
+
+    if args.jobs > 1:
+        with ProcessPoolExecutor(
+            args.jobs, initializer=_load_schemes, initargs=(args.dict, args.scheme)
+        ) as executor:
+            # Batches are converted in order of submission and written in
+            # the same order, with a bounded number of them in flight
+            pending = deque()
+            for batch in batches():
+                pending.append(executor.submit(_convert_batch, batch, separator))
+                if len(pending) >= 2 * args.jobs:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    else:
+        for batch in batches():
+            write(_convert_batch(batch, separator))
+
+    for output in outputs:
+        if output is not sys.stdout.buffer:
+            output.close()
+    seconds = time.perf_counter() - started
+    print(
+        str(units)
+        + (" paragraphs" if args.paragraphs else " lines")
+        + " in "
+        + format(seconds, ".2f")
+        + " s, "
+        + format(units / seconds if seconds else 0, ".0f")
+        + "/s",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from setuptools import setup
 setup(
     name="KxelBot",
     version="",
-    py_modules=["logging", "os", "unicodedata", "re"],
+    py_modules=["logging", "os", "unicodedata", "re", "scriptcon"],
     packages=[""],
     url="https://github.com/MiguelX413/KxelBot",
     license="AGPL 3.0",
@@ -11,5 +11,6 @@ setup(
     author_email="",
     description="",
     scripts=["bot.py"],
+    entry_points={"console_scripts": ["scriptcon=scriptcon:main"]},
     install_requires=["python-telegram-bot"],
 )
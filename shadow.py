@@ -0,0 +1,92 @@
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Stale(Exception):
+    """Raised by a reference that can no longer say what a conversion
+    should have returned, such as after the dictionaries were reloaded."""
+
+
+class Shadow:
+    """Converts a sample of what the bot converts again with a reference, in
+    a thread of its own, and logs every result that differs.
+
+    check() samples fraction of the conversions it is given. Those that find
+    queue_size of them already waiting for the reference are skipped rather
+    than held up, as are all of them while the reference is stuck on one, and
+    those for which the reference raises Stale."""
+
+    def __init__(self, reference, fraction, queue_size=64):
+        self.reference = reference
+        self.fraction = fraction
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self.compared = 0
+        self.mismatches = 0
+        self.errors = 0
+        self.skipped = 0
+        # Time taken by the conversions compared and by the reference
+        self.seconds = 0.0
+        self.reference_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="shadow", daemon=True)
+        self._thread.start()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def check(self, args, result, seconds):
+        """Compares result, which took seconds to make, with reference(*args)
+        if this conversion is sampled."""
+        if random.random() >= self.fraction:
+            return
+        try:
+            self._queue.put_nowait((args, result, seconds))
+        except queue.Full:
+            self._count("skipped")
+
+    def _run(self):
+        while True:
+            args, result, seconds = self._queue.get()
+            started = time.perf_counter()
+            try:
+                expected = self.reference(*args)
+            except Stale:
+                self._count("skipped")
+                continue
+            except Exception:
+                logger.exception("Reference failed on %r", args)
+                self._count("errors")
+                continue
+            reference_seconds = time.perf_counter() - started
+            with self._lock:
+                self.compared += 1
+                self.seconds += seconds
+                self.reference_seconds += reference_seconds
+            if expected != result:
+                self._count("mismatches")
+                logger.warning(
+                    "Mismatch on %r: %r in %.3f ms, reference %r in %.3f ms",
+                    args,
+                    result,
+                    seconds * 1000,
+                    expected,
+                    reference_seconds * 1000,
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "fraction": self.fraction,
+                "compared": self.compared,
+                "mismatches": self.mismatches,
+                "errors": self.errors,
+                "skipped": self.skipped,
+                "ms": round(self.seconds * 1000, 1),
+                "reference_ms": round(self.reference_seconds * 1000, 1),
+            }
@@ -0,0 +1,137 @@
+import gc
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing import connection
+
+logger = logging.getLogger(__name__)
+
+
+def _serve(index, updates, make_dispatcher):
+    """Handles the updates a ShardSupervisor sends to the worker process it
+    forked, until it sends None."""
+    from telegram import Update
+
+    # The supervisor stops its workers itself when interrupted
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    dispatcher = make_dispatcher(index)
+    while True:
+        data = updates.get()
+        if data is None:
+            break
+        dispatcher.process_update(Update.de_json(data, dispatcher.bot))
+    dispatcher.stop()
+
+
+class ShardSupervisor:
+    """Handles a bot's updates in worker processes forked from this one, so
+    that they share whatever it loaded before, such as the compiled schemes,
+    for as long as they do not write to it.
+
+    make_dispatcher(index) is called in each worker for the
+    telegram.ext.Dispatcher that handles its updates, with a bot of its own.
+    It is not pickled, so it may refer to anything in this process.
+
+    dispatch() sends each update to the worker for its user, so that every
+    user's updates are handled in order by the same worker, and a worker
+    that exits is forked again. Updates that were queued for it when it did
+    are lost."""
+
+    # A worker that exits sooner than this after starting waits this long
+    # before it is forked again, rather than crashing over and over
+    restart_delay = 1.0
+
+    def __init__(self, shards, make_dispatcher):
+        self.shards = shards
+        self._make_dispatcher = make_dispatcher
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._workers = [None] * shards
+        self.dispatched = 0
+        self.restarts = 0
+        # Keeps the collector away from everything loaded so far, which
+        # would otherwise copy the pages it marks into every worker
+        gc.freeze()
+        for index in range(shards):
+            self._start(index)
+        self._monitor = threading.Thread(
+            target=self._restart_exited, name="shard-monitor", daemon=True
+        )
+        self._monitor.start()
+
+    def _start(self, index):
+        context = multiprocessing.get_context("fork")
+        updates = context.Queue()
+        process = context.Process(
+            target=_serve,
+            args=(index, updates, self._make_dispatcher),
+            name="shard-" + str(index),
+            daemon=True,
+        )
+        process.start()
+        self._workers[index] = (process, updates, time.monotonic())
+
+    def _restart_exited(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                sentinels = {
+                    process.sentinel: index
+                    for index, (process, _, _) in enumerate(self._workers)
+                }
+            for sentinel in connection.wait(list(sentinels), timeout=1.0):
+                if self._stopping.is_set():
+                    return
+                index = sentinels[sentinel]
+                process, updates, started = self._workers[index]
+                process.join()
+                logger.error(
+                    "Shard %d exited with code %s, restarting it",
+                    index,
+                    process.exitcode,
+                )
+                if time.monotonic() - started < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                with self._lock:
+                    updates.close()
+                    self._start(index)
+                    self.restarts += 1
+
+    def dispatch(self, update, _=None):
+        """Sends a telegram.Update to the worker for its user, for use as a
+        handler."""
+        user = update.effective_user
+        key = user.id if user is not None else update.update_id
+        with self._lock:
+            _, updates, _ = self._workers[key % self.shards]
+            updates.put(update.to_dict())
+            self.dispatched += 1
+
+    def signal(self, signum):
+        """Sends a signal to every worker."""
+        with self._lock:
+            for process, _, _ in self._workers:
+                try:
+                    os.kill(process.pid, signum)
+                except ProcessLookupError:
+                    pass
+
+    def stop(self, timeout=5.0):
+        """Lets every worker finish what is queued for it, waiting up to
+        timeout seconds for each."""
+        self._stopping.set()
+        self._monitor.join()
+        for process, updates, _ in self._workers:
+            updates.put(None)
+        for process, _, _ in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        logger.info(
+            "Dispatched %d updates to %d shards, restarted %d times",
+            self.dispatched,
+            self.shards,
+            self.restarts,
+        )
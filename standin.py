@@ -0,0 +1,66 @@
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+bot_user = {"id": 1, "is_bot": True, "first_name": "KxelBot", "username": "KxelBot"}
+
+
+def message(params):
+    return {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": int(params.get("chat_id", 1)), "type": "private"},
+        "from": bot_user,
+        "text": params.get("text", ""),
+    }
+
+
+# What the stand-in answers to the methods that need more than True, by name
+results = {
+    "getMe": lambda params: bot_user,
+    "sendMessage": message,
+    "getUpdates": lambda params: [],
+    "getWebhookInfo": lambda params: {"url": "", "pending_update_count": 0},
+}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers every Bot API call as Telegram would if it went well, and
+    prints it."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        method = self.path.rsplit("/", 1)[-1]
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            params = json.loads(body or b"{}")
+        else:
+            params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+        print(method + " " + json.dumps(params, ensure_ascii=False), flush=True)
+        if method == "getUpdates":
+            # Long polling with nothing to deliver
+            time.sleep(min(float(params.get("timeout", 0)), 1.0))
+        result = results.get(method, lambda params: True)(params)
+        answer = json.dumps({"ok": True, "result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(answer)))
+        self.end_headers()
+        self.wfile.write(answer)
+
+    do_GET = do_POST
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Runs a stand-in Bot API server for bot.py --base-url, so"
+        " that the bot can be run without reaching Telegram"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=9000, help="Port to listen on")
+    args = parser.parse_args()
+    ThreadingHTTPServer((args.host, args.port), StandIn).serve_forever()